@@ -1,5 +1,13 @@
 // C binding for libfreenect2
 
+#include <atomic>
+#include <chrono>
+#include <condition_variable>
+#include <cstring>
+#include <memory>
+#include <mutex>
+#include <vector>
+
 #include <libfreenect2/libfreenect2.hpp>
 #include <libfreenect2/registration.h>
 
@@ -28,6 +36,15 @@ typedef enum {
     FRAME_FORMAT_GRAY = Frame::Gray,
 } Freenect2FrameFormat;
 
+typedef struct {
+    size_t width, height, bytes_per_pixel;
+    void* data;
+    uint32_t timestamp, sequence;
+    float exposure, gain, gamma;
+    uint32_t status;
+    Freenect2FrameFormat format;
+} Freenect2FrameInfo;
+
 typedef Freenect2Device::IrCameraParams IrCameraParams;
 typedef Freenect2Device::ColorCameraParams ColorCameraParams;
 
@@ -47,6 +64,25 @@ static int freenect2_enumerate_devices(Freenect2Ref fn2_ref)
     return fn2->enumerateDevices();
 }
 
+// Copy a string into a caller-supplied buffer. Returns the length of the string
+// which may be greater than or equal to out_len if it was truncated.
+static size_t copy_string(const std::string& str, char* out, size_t out_len)
+{
+    if(out_len > 0) {
+        size_t n = (str.size() < out_len - 1) ? str.size() : out_len - 1;
+        str.copy(out, n);
+        out[n] = '\0';
+    }
+    return str.size();
+}
+
+static size_t freenect2_get_device_serial_number(
+    Freenect2Ref fn2_ref, int index, char* out, size_t out_len)
+{
+    Freenect2* fn2 = reinterpret_cast<Freenect2*>(fn2_ref);
+    return copy_string(fn2->getDeviceSerialNumber(index), out, out_len);
+}
+
 static Freenect2DeviceRef freenect2_open_default_device(Freenect2Ref fn2_ref)
 {
     Freenect2* fn2 = reinterpret_cast<Freenect2*>(fn2_ref);
@@ -67,11 +103,25 @@ static Freenect2DeviceRef freenect2_open_device_by_serial(
         fn2->openDevice(std::string(serial)));
 }
 
+static size_t freenect2_device_get_serial_number(
+    Freenect2DeviceRef device_ref, char* out, size_t out_len)
+{
+    Freenect2Device* device = reinterpret_cast<Freenect2Device*>(device_ref);
+    return copy_string(device->getSerialNumber(), out, out_len);
+}
+
 static int freenect2_device_start(Freenect2DeviceRef device_ref) {
     Freenect2Device* device = reinterpret_cast<Freenect2Device*>(device_ref);
     return device->start();
 }
 
+static int freenect2_device_start_streams(
+    Freenect2DeviceRef device_ref, int rgb, int depth)
+{
+    Freenect2Device* device = reinterpret_cast<Freenect2Device*>(device_ref);
+    return device->startStreams(rgb != 0, depth != 0);
+}
+
 static int freenect2_device_stop(Freenect2DeviceRef device_ref) {
     Freenect2Device* device = reinterpret_cast<Freenect2Device*>(device_ref);
     return device->stop();
@@ -112,37 +162,223 @@ static ColorCameraParams freenect2_device_get_color_camera_params(
     return device->getColorCameraParams();
 }
 
+class FramePool;
+
+// A frame whose buffer belongs to a FramePool. Disposing of it returns it to
+// the pool rather than freeing the buffer.
+class PooledFrame : public Frame
+{
+public:
+    PooledFrame(size_t capacity, const std::shared_ptr<FramePool> &pool)
+    : Frame(capacity, 1, 1), capacity(capacity), pool(pool) { }
+
+    size_t capacity;
+    std::shared_ptr<FramePool> pool;
+};
+
+// A bounded free list of frame buffers. Listeners copy each new frame into a
+// pooled frame and return false so that libfreenect2 re-uses its own buffer.
+// Once frames are returned as quickly as they arrive no memory is allocated.
+//
+// Frames hold a reference to the pool and so may outlive the listener which
+// created them. Closing the pool frees idle buffers and frames returned
+// afterwards are deleted.
+class FramePool : public std::enable_shared_from_this<FramePool>
+{
+public:
+    FramePool(size_t max_free) : max_free_(max_free), closed_(false) { }
+
+    ~FramePool()
+    {
+        for(size_t i=0; i<free_.size(); ++i) { delete free_[i]; }
+    }
+
+    // Return a pooled copy of frame.
+    Frame* copy(const Frame *frame)
+    {
+        size_t size = frame->width * frame->height * frame->bytes_per_pixel;
+        PooledFrame *pooled = NULL;
+        {
+            // Use the smallest idle buffer which is large enough.
+            std::lock_guard<std::mutex> lock(mutex_);
+            size_t best = free_.size();
+            for(size_t i=0; i<free_.size(); ++i) {
+                if(free_[i]->capacity >= size && (
+                        best == free_.size() ||
+                        free_[i]->capacity < free_[best]->capacity)) {
+                    best = i;
+                }
+            }
+            if(best != free_.size()) {
+                pooled = free_[best];
+                free_[best] = free_.back();
+                free_.pop_back();
+            }
+        }
+        if(pooled == NULL) {
+            pooled = new PooledFrame(size, shared_from_this());
+        }
+
+        pooled->width = frame->width;
+        pooled->height = frame->height;
+        pooled->bytes_per_pixel = frame->bytes_per_pixel;
+        pooled->timestamp = frame->timestamp;
+        pooled->sequence = frame->sequence;
+        pooled->exposure = frame->exposure;
+        pooled->gain = frame->gain;
+        pooled->gamma = frame->gamma;
+        pooled->status = frame->status;
+        pooled->format = frame->format;
+        std::memcpy(pooled->data, frame->data, size);
+        return pooled;
+    }
+
+    void recycle(PooledFrame *frame)
+    {
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            if(!closed_ && free_.size() < max_free_) {
+                free_.push_back(frame);
+                return;
+            }
+        }
+        // Deleting the frame may delete the pool and so must come last.
+        delete frame;
+    }
+
+    void close()
+    {
+        std::vector<PooledFrame*> idle;
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            closed_ = true;
+            idle.swap(free_);
+        }
+        for(size_t i=0; i<idle.size(); ++i) { delete idle[i]; }
+    }
+
+private:
+    size_t max_free_;
+    bool closed_;
+    std::vector<PooledFrame*> free_;
+    std::mutex mutex_;
+};
+
+// Delete a frame or return it to its pool.
+static void dispose_frame(Frame *frame)
+{
+    PooledFrame *pooled = dynamic_cast<PooledFrame*>(frame);
+    if(pooled != NULL) {
+        pooled->pool->recycle(pooled);
+    } else {
+        delete frame;
+    }
+}
+
+static std::shared_ptr<FramePool> make_frame_pool(size_t max_free)
+{
+    if(max_free == 0) { return std::shared_ptr<FramePool>(); }
+    return std::make_shared<FramePool>(max_free);
+}
+
+// Index of a frame type in per-type arrays.
+static int frame_type_index(Frame::Type type)
+{
+    switch(type) {
+        case Frame::Color: return 0;
+        case Frame::Ir: return 1;
+        default: return 2;
+    }
+}
+
+// Base class for listeners which deliver only some frames. Each frame type may
+// be rejected entirely or decimated to every Nth frame. Rejected frames are
+// left with libfreenect2 before any copy is made or Python is called.
+class FilteringFrameListener : public FrameListener
+{
+public:
+    FilteringFrameListener()
+    {
+        for(int i=0; i<3; ++i) { every_[i] = 1; count_[i] = 0; }
+    }
+
+    // Deliver every Nth frame of type. Zero rejects all frames of the type.
+    void set_decimation(Frame::Type type, unsigned int every)
+    {
+        int idx = frame_type_index(type);
+        every_[idx].store(every, std::memory_order_relaxed);
+        count_[idx].store(0, std::memory_order_relaxed);
+    }
+
+protected:
+    bool accept(Frame::Type type)
+    {
+        int idx = frame_type_index(type);
+        unsigned int every = every_[idx].load(std::memory_order_relaxed);
+        if(every <= 1) { return every == 1; }
+        return count_[idx].fetch_add(1, std::memory_order_relaxed) % every == 0;
+    }
+
+private:
+    std::atomic<unsigned int> every_[3];
+    std::atomic<unsigned int> count_[3];
+};
+
+static void freenect2_frame_listener_set_decimation(
+    Freenect2FrameListenerRef fl_ref, Freenect2FrameType type,
+    unsigned int every)
+{
+    FrameListener* fl = reinterpret_cast<FrameListener*>(fl_ref);
+    static_cast<FilteringFrameListener*>(fl)->set_decimation(
+        static_cast<Frame::Type>(type), every);
+}
+
 typedef int (*Freenect2FrameListenerFunc) (
     Freenect2FrameType type, Freenect2FrameRef frame, void *user_data);
 
-class Freenect2FrameListener : public FrameListener
+class Freenect2FrameListener : public FilteringFrameListener
 {
 public:
     Freenect2FrameListener(
         Freenect2FrameListenerFunc func,
-        void* user_data=NULL)
-    : func_(func), user_data_(user_data) { }
+        void* user_data=NULL, size_t pool_size=0)
+    : func_(func), user_data_(user_data), pool_(make_frame_pool(pool_size)) { }
 
-    virtual ~Freenect2FrameListener() { }
+    virtual ~Freenect2FrameListener()
+    {
+        if(pool_) { pool_->close(); }
+    }
 
     virtual bool onNewFrame(Frame::Type type, Frame *frame)
     {
-        return func_(
-            static_cast<Freenect2FrameType>(type),
-            reinterpret_cast<Freenect2FrameRef>(frame),
-            user_data_);
+        if(!accept(type)) { return false; }
+
+        if(!pool_) {
+            return func_(
+                static_cast<Freenect2FrameType>(type),
+                reinterpret_cast<Freenect2FrameRef>(frame),
+                user_data_);
+        }
+
+        Frame *pooled = pool_->copy(frame);
+        if(!func_(static_cast<Freenect2FrameType>(type),
+                  reinterpret_cast<Freenect2FrameRef>(pooled), user_data_)) {
+            dispose_frame(pooled);
+        }
+        return false;
     }
 
 protected:
     Freenect2FrameListenerFunc func_;
     void *user_data_;
+    std::shared_ptr<FramePool> pool_;
 };
 
 static Freenect2FrameListenerRef freenect2_frame_listener_create(
-    Freenect2FrameListenerFunc func, void* user_data)
+    Freenect2FrameListenerFunc func, void* user_data, size_t pool_size)
 {
     return reinterpret_cast<Freenect2FrameListenerRef>(
-        new Freenect2FrameListener(func, user_data));
+        new Freenect2FrameListener(func, user_data, pool_size));
 }
 
 static void freenect2_frame_listener_dispose(Freenect2FrameListenerRef fl_ref)
@@ -151,6 +387,211 @@ static void freenect2_frame_listener_dispose(Freenect2FrameListenerRef fl_ref)
     delete fl;
 }
 
+// A fixed-capacity ring of frames with a single producer. The consumer side
+// claims slots with a compare-and-swap so that the producer may also discard
+// the oldest frame when the ring is full.
+class FrameRing
+{
+public:
+    FrameRing(size_t capacity)
+    : slots_(capacity), head_(0), tail_(0) { }
+
+    ~FrameRing()
+    {
+        Freenect2FrameType type;
+        Frame *frame;
+        while(pop(type, frame)) { dispose_frame(frame); }
+    }
+
+    // Called by the producer. If the ring is full, the oldest frame is
+    // disposed of if drop_oldest is true and *dropped is set to its type.
+    // Otherwise false is returned and the caller retains the frame.
+    bool push(Freenect2FrameType type, Frame *frame, bool drop_oldest,
+              int *dropped)
+    {
+        size_t tail = tail_.load(std::memory_order_relaxed);
+        size_t head = head_.load(std::memory_order_acquire);
+        *dropped = -1;
+        while(tail - head >= slots_.size()) {
+            if(!drop_oldest) { return false; }
+            Slot &oldest = slots_[head % slots_.size()];
+            Freenect2FrameType oldest_type = oldest.type.load(std::memory_order_relaxed);
+            Frame *oldest_frame = oldest.frame.load(std::memory_order_relaxed);
+            if(head_.compare_exchange_weak(head, head + 1, std::memory_order_acq_rel)) {
+                dispose_frame(oldest_frame);
+                *dropped = oldest_type;
+                break;
+            }
+        }
+
+        Slot &slot = slots_[tail % slots_.size()];
+        slot.type.store(type, std::memory_order_relaxed);
+        slot.frame.store(frame, std::memory_order_relaxed);
+        tail_.store(tail + 1, std::memory_order_seq_cst);
+        return true;
+    }
+
+    // Called by the consumer. Returns false if the ring is empty.
+    bool pop(Freenect2FrameType &type, Frame *&frame)
+    {
+        size_t head = head_.load(std::memory_order_acquire);
+        while(head != tail_.load(std::memory_order_acquire)) {
+            Slot &slot = slots_[head % slots_.size()];
+            type = slot.type.load(std::memory_order_relaxed);
+            frame = slot.frame.load(std::memory_order_relaxed);
+            if(head_.compare_exchange_weak(head, head + 1, std::memory_order_acq_rel)) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    bool empty() const
+    {
+        return head_.load(std::memory_order_seq_cst) == tail_.load(std::memory_order_seq_cst);
+    }
+
+private:
+    struct Slot {
+        std::atomic<Freenect2FrameType> type;
+        std::atomic<Frame*> frame;
+    };
+
+    std::vector<Slot> slots_;
+    std::atomic<size_t> head_;
+    std::atomic<size_t> tail_;
+};
+
+// A frame listener which stores frames in ring buffers without calling back
+// into Python. Color frames and IR/depth frames are delivered by different
+// libfreenect2 threads and so each has its own ring with a single producer.
+class Freenect2RingFrameListener : public FilteringFrameListener
+{
+public:
+    Freenect2RingFrameListener(size_t capacity, bool drop_oldest,
+                               size_t pool_size=0)
+    : color_ring_(capacity), ir_and_depth_ring_(capacity),
+      drop_oldest_(drop_oldest), pool_(make_frame_pool(pool_size)),
+      waiting_(0), next_ring_(0)
+    {
+        for(int i=0; i<3; ++i) { dropped_[i] = 0; }
+    }
+
+    virtual ~Freenect2RingFrameListener()
+    {
+        if(pool_) { pool_->close(); }
+    }
+
+    virtual bool onNewFrame(Frame::Type type, Frame *frame)
+    {
+        if(!accept(type)) { return false; }
+
+        FrameRing &ring = (type == Frame::Color) ? color_ring_ : ir_and_depth_ring_;
+        Frame *stored = pool_ ? pool_->copy(frame) : frame;
+        int dropped_type;
+        if(!ring.push(static_cast<Freenect2FrameType>(type), stored,
+                      drop_oldest_, &dropped_type)) {
+            ++dropped_[frame_type_index(type)];
+            if(pool_) { dispose_frame(stored); }
+            return false;
+        }
+        if(dropped_type >= 0) {
+            ++dropped_[frame_type_index(static_cast<Frame::Type>(dropped_type))];
+        }
+
+        if(waiting_.load(std::memory_order_seq_cst) > 0) {
+            std::lock_guard<std::mutex> lock(mutex_);
+            cv_.notify_all();
+        }
+        return !pool_;
+    }
+
+    // Wait up to timeout seconds (forever if negative) for a frame and then
+    // pop up to max_frames frames. Returns the number of frames popped.
+    size_t drain(Freenect2FrameType *types, Frame **frames, size_t max_frames,
+                 double timeout)
+    {
+        if(timeout != 0.0 && color_ring_.empty() && ir_and_depth_ring_.empty()) {
+            std::unique_lock<std::mutex> lock(mutex_);
+            ++waiting_;
+            auto ready = [this]() {
+                return !color_ring_.empty() || !ir_and_depth_ring_.empty();
+            };
+            if(timeout < 0.0) {
+                cv_.wait(lock, ready);
+            } else {
+                cv_.wait_for(lock, std::chrono::duration<double>(timeout), ready);
+            }
+            --waiting_;
+        }
+
+        // Alternate between rings so that neither stream starves the other.
+        size_t n_frames = 0;
+        FrameRing *rings[2] = { &color_ring_, &ir_and_depth_ring_ };
+        bool any = true;
+        while(any && n_frames < max_frames) {
+            any = false;
+            for(int i=0; i<2 && n_frames < max_frames; ++i) {
+                FrameRing *ring = rings[(next_ring_ + i) % 2];
+                if(ring->pop(types[n_frames], frames[n_frames])) {
+                    ++n_frames;
+                    any = true;
+                }
+            }
+            next_ring_ = (next_ring_ + 1) % 2;
+        }
+        return n_frames;
+    }
+
+    uint64_t dropped(Frame::Type type) const
+    {
+        return dropped_[frame_type_index(type)].load();
+    }
+
+protected:
+    FrameRing color_ring_, ir_and_depth_ring_;
+    bool drop_oldest_;
+    std::shared_ptr<FramePool> pool_;
+    std::atomic<uint64_t> dropped_[3];
+    std::atomic<int> waiting_;
+    std::mutex mutex_;
+    std::condition_variable cv_;
+    int next_ring_;
+};
+
+static Freenect2RingFrameListener* as_ring_frame_listener(Freenect2FrameListenerRef fl_ref)
+{
+    return static_cast<Freenect2RingFrameListener*>(
+        reinterpret_cast<FrameListener*>(fl_ref));
+}
+
+static Freenect2FrameListenerRef freenect2_ring_frame_listener_create(
+    size_t capacity, int drop_oldest, size_t pool_size)
+{
+    FrameListener* fl = new Freenect2RingFrameListener(
+        capacity, drop_oldest != 0, pool_size);
+    return reinterpret_cast<Freenect2FrameListenerRef>(fl);
+}
+
+static void freenect2_ring_frame_listener_dispose(Freenect2FrameListenerRef fl_ref)
+{
+    delete as_ring_frame_listener(fl_ref);
+}
+
+static size_t freenect2_ring_frame_listener_drain(
+    Freenect2FrameListenerRef fl_ref, Freenect2FrameType* types,
+    Freenect2FrameRef* frames, size_t max_frames, double timeout)
+{
+    return as_ring_frame_listener(fl_ref)->drain(
+        types, reinterpret_cast<Frame**>(frames), max_frames, timeout);
+}
+
+static uint64_t freenect2_ring_frame_listener_get_dropped(
+    Freenect2FrameListenerRef fl_ref, Freenect2FrameType type)
+{
+    return as_ring_frame_listener(fl_ref)->dropped(static_cast<Frame::Type>(type));
+}
+
 static Freenect2FrameRef freenect2_frame_create(
     size_t width, size_t height, size_t bytes_per_pixel)
 {
@@ -158,10 +599,34 @@ static Freenect2FrameRef freenect2_frame_create(
         new Frame(width, height, bytes_per_pixel));
 }
 
+static Freenect2FrameRef freenect2_frame_create_with_data(
+    size_t width, size_t height, size_t bytes_per_pixel, void* data)
+{
+    // The frame does not own data and will not free it
+    return reinterpret_cast<Freenect2FrameRef>(
+        new Frame(width, height, bytes_per_pixel,
+            reinterpret_cast<unsigned char*>(data)));
+}
+
 static void freenect2_frame_dispose(Freenect2FrameRef frame_ref)
+{
+    dispose_frame(reinterpret_cast<Frame*>(frame_ref));
+}
+
+static void freenect2_frame_get_info(Freenect2FrameRef frame_ref, Freenect2FrameInfo* info)
 {
     Frame* frame = reinterpret_cast<Frame*>(frame_ref);
-    delete frame;
+    info->width = frame->width;
+    info->height = frame->height;
+    info->bytes_per_pixel = frame->bytes_per_pixel;
+    info->data = frame->data;
+    info->timestamp = frame->timestamp;
+    info->sequence = frame->sequence;
+    info->exposure = frame->exposure;
+    info->gain = frame->gain;
+    info->gamma = frame->gamma;
+    info->status = frame->status;
+    info->format = static_cast<Freenect2FrameFormat>(frame->format);
 }
 
 static size_t freenect2_frame_get_width(Freenect2FrameRef frame_ref)
@@ -320,6 +785,16 @@ static void freenect2_registration_apply(
         (enable_filter != 0) ? true : false, big_depth);
 }
 
+static void freenect2_registration_undistort_depth(
+    Freenect2RegistrationRef reg_ref, Freenect2FrameRef depth_ref,
+    Freenect2FrameRef undistorted_ref)
+{
+    Registration* reg = reinterpret_cast<Registration*>(reg_ref);
+    Frame* depth = reinterpret_cast<Frame*>(depth_ref);
+    Frame* undistorted = reinterpret_cast<Frame*>(undistorted_ref);
+    reg->undistortDepth(depth, undistorted);
+}
+
 static void freenect2_registration_get_points_xyz(
     Freenect2RegistrationRef reg_ref, Freenect2FrameRef undistorted_ref,
     const int32_t* rows, const int32_t* cols, size_t n_points,
@@ -334,3 +809,445 @@ static void freenect2_registration_get_points_xyz(
             out_xs[p_idx], out_ys[p_idx], out_zs[p_idx]);
     }
 }
+
+// LZF compression as used by PCD "binary_compressed" data. The output is
+// compatible with liblzf's lzf_decompress. Both functions return the number
+// of bytes written to out or 0 if out is too small or in is malformed.
+
+#define LZF_HLOG 14
+#define LZF_MAX_LITERAL 32
+#define LZF_MAX_OFFSET 8192
+#define LZF_MAX_REF 264
+
+static size_t freenect2_lzf_compress(
+    const void* in_data, size_t in_len, void* out_data, size_t out_len)
+{
+    const uint8_t* ip = reinterpret_cast<const uint8_t*>(in_data);
+    const uint8_t* in_end = ip + in_len;
+    uint8_t* out = reinterpret_cast<uint8_t*>(out_data);
+    uint8_t* op = out;
+    uint8_t* out_end = out + out_len;
+    std::vector<const uint8_t*> htab(1 << LZF_HLOG, nullptr);
+
+    if((in_len == 0) || (out_len == 0))
+        return 0;
+
+    // Each literal run is preceded by a control byte which is filled in when
+    // the run ends.
+    size_t lit = 0;
+    uint8_t* lit_ctrl = op++;
+
+    while(ip < in_end)
+    {
+        if(ip + 2 < in_end)
+        {
+            uint32_t v = (uint32_t(ip[0]) << 16) | (uint32_t(ip[1]) << 8) | ip[2];
+            uint32_t h = (v * 2654435761u) >> (32 - LZF_HLOG);
+            const uint8_t* ref = htab[h];
+            htab[h] = ip;
+
+            if((ref != nullptr) && (size_t(ip - ref) <= LZF_MAX_OFFSET)
+                && (ref[0] == ip[0]) && (ref[1] == ip[1]) && (ref[2] == ip[2]))
+            {
+                size_t max_len = in_end - ip;
+                if(max_len > LZF_MAX_REF)
+                    max_len = LZF_MAX_REF;
+                size_t len = 3;
+                while((len < max_len) && (ref[len] == ip[len]))
+                    ++len;
+
+                if(lit > 0)
+                    *lit_ctrl = uint8_t(lit - 1);
+                else
+                    --op;
+
+                // Back reference plus the next literal control byte
+                if(op + 4 > out_end)
+                    return 0;
+                size_t off = ip - ref - 1;
+                size_t l = len - 2;
+                if(l < 7)
+                {
+                    *op++ = uint8_t((off >> 8) + (l << 5));
+                }
+                else
+                {
+                    *op++ = uint8_t((off >> 8) + (7 << 5));
+                    *op++ = uint8_t(l - 7);
+                }
+                *op++ = uint8_t(off & 0xff);
+
+                lit = 0;
+                lit_ctrl = op++;
+
+                // Hash the positions covered by the match so that later
+                // matches can refer to them.
+                const uint8_t* match_end = ip + len;
+                for(++ip; (ip < match_end) && (ip + 2 < in_end); ++ip)
+                {
+                    v = (uint32_t(ip[0]) << 16) | (uint32_t(ip[1]) << 8) | ip[2];
+                    htab[(v * 2654435761u) >> (32 - LZF_HLOG)] = ip;
+                }
+                ip = match_end;
+                continue;
+            }
+        }
+
+        if(op >= out_end)
+            return 0;
+        *op++ = *ip++;
+        if(++lit == LZF_MAX_LITERAL)
+        {
+            *lit_ctrl = uint8_t(lit - 1);
+            lit = 0;
+            if(op >= out_end)
+                return 0;
+            lit_ctrl = op++;
+        }
+    }
+
+    if(lit > 0)
+        *lit_ctrl = uint8_t(lit - 1);
+    else
+        --op;
+
+    return op - out;
+}
+
+static size_t freenect2_lzf_decompress(
+    const void* in_data, size_t in_len, void* out_data, size_t out_len)
+{
+    const uint8_t* ip = reinterpret_cast<const uint8_t*>(in_data);
+    const uint8_t* in_end = ip + in_len;
+    uint8_t* out = reinterpret_cast<uint8_t*>(out_data);
+    uint8_t* op = out;
+    uint8_t* out_end = out + out_len;
+
+    while(ip < in_end)
+    {
+        size_t ctrl = *ip++;
+        if(ctrl < 32)
+        {
+            size_t len = ctrl + 1;
+            if((size_t(out_end - op) < len) || (size_t(in_end - ip) < len))
+                return 0;
+            memcpy(op, ip, len);
+            op += len;
+            ip += len;
+        }
+        else
+        {
+            size_t len = ctrl >> 5;
+            if(len == 7)
+            {
+                if(ip >= in_end)
+                    return 0;
+                len += *ip++;
+            }
+            if(ip >= in_end)
+                return 0;
+            size_t back = ((ctrl & 0x1f) << 8) + *ip++ + 1;
+            len += 2;
+            if((back > size_t(op - out)) || (size_t(out_end - op) < len))
+                return 0;
+
+            // Copy byte by byte since the reference may overlap the output
+            const uint8_t* ref = op - back;
+            for(size_t idx=0; idx<len; ++idx)
+                *op++ = *ref++;
+        }
+    }
+
+    return op - out;
+}
+
+// RVL depth compression (A. Wilson, "Fast Lossless Depth Image Compression",
+// 2017). Depth is coded as uint16 millimetres: runs of zero (invalid) pixels
+// and of valid pixels alternate and each valid pixel is stored as the
+// zig-zag coded difference from the previous valid pixel. All values are
+// written as variable length groups of 3-bit nibbles packed into
+// little-endian 32-bit words.
+
+class RvlWriter
+{
+public:
+    RvlWriter(uint8_t* out, size_t out_len)
+        : out_(out), end_(out + out_len), op_(out), word_(0), nibbles_(0),
+        overflow_(false)
+    { }
+
+    void put(uint32_t value)
+    {
+        do
+        {
+            uint32_t nibble = value & 0x7;
+            if(value >>= 3)
+                nibble |= 0x8;
+            word_ = (word_ << 4) | nibble;
+            if(++nibbles_ == 8)
+                flush_word();
+        } while(value);
+    }
+
+    size_t finish()
+    {
+        if(nibbles_ > 0)
+        {
+            word_ <<= 4 * (8 - nibbles_);
+            flush_word();
+        }
+        return overflow_ ? 0 : op_ - out_;
+    }
+
+private:
+    void flush_word()
+    {
+        if(end_ - op_ < 4)
+        {
+            overflow_ = true;
+        }
+        else
+        {
+            for(int idx=0; idx<4; ++idx)
+                *op_++ = uint8_t(word_ >> (8 * idx));
+        }
+        word_ = 0;
+        nibbles_ = 0;
+    }
+
+    uint8_t *out_, *end_, *op_;
+    uint32_t word_;
+    int nibbles_;
+    bool overflow_;
+};
+
+class RvlReader
+{
+public:
+    RvlReader(const uint8_t* in, size_t in_len)
+        : ip_(in), end_(in + in_len), word_(0), nibbles_(0), error_(false)
+    { }
+
+    uint32_t get()
+    {
+        uint32_t value = 0;
+        for(int shift=0; ; shift += 3)
+        {
+            if(shift > 30)
+            {
+                error_ = true;
+                return 0;
+            }
+            if(nibbles_ == 0)
+            {
+                if(end_ - ip_ < 4)
+                {
+                    error_ = true;
+                    return 0;
+                }
+                word_ = uint32_t(ip_[0]) | (uint32_t(ip_[1]) << 8)
+                    | (uint32_t(ip_[2]) << 16) | (uint32_t(ip_[3]) << 24);
+                ip_ += 4;
+                nibbles_ = 8;
+            }
+            uint32_t nibble = word_ >> 28;
+            word_ <<= 4;
+            --nibbles_;
+            value |= (nibble & 0x7) << shift;
+            if(!(nibble & 0x8))
+                return value;
+        }
+    }
+
+    bool error() const { return error_; }
+
+private:
+    const uint8_t *ip_, *end_;
+    uint32_t word_;
+    int nibbles_;
+    bool error_;
+};
+
+static inline uint16_t depth_to_mm(uint16_t value) { return value; }
+
+static inline uint16_t depth_to_mm(float value)
+{
+    // Written so that NaN compares false and maps to zero
+    if(!(value > 0.f))
+        return 0;
+    if(value >= 65534.5f)
+        return 65535;
+    return uint16_t(value + 0.5f);
+}
+
+template<typename T>
+static size_t rvl_encode(
+    const T* in, size_t n_pixels, uint8_t* out, size_t out_len)
+{
+    RvlWriter writer(out, out_len);
+    const T* end = in + n_pixels;
+    int32_t previous = 0;
+    while(in != end)
+    {
+        uint32_t zeros = 0, nonzeros = 0;
+        for(; (in != end) && (depth_to_mm(*in) == 0); ++in)
+            ++zeros;
+        writer.put(zeros);
+        for(const T* p = in; (p != end) && (depth_to_mm(*p) != 0); ++p)
+            ++nonzeros;
+        writer.put(nonzeros);
+        for(uint32_t idx=0; idx<nonzeros; ++idx, ++in)
+        {
+            int32_t current = depth_to_mm(*in);
+            int32_t delta = current - previous;
+            writer.put((uint32_t(delta) << 1) ^ uint32_t(delta >> 31));
+            previous = current;
+        }
+    }
+    return writer.finish();
+}
+
+template<typename T>
+static int rvl_decode(
+    const uint8_t* in, size_t in_len, T* out, size_t n_pixels)
+{
+    RvlReader reader(in, in_len);
+    size_t remaining = n_pixels;
+    int32_t previous = 0;
+    while(remaining > 0)
+    {
+        uint32_t zeros = reader.get();
+        if(reader.error() || (zeros > remaining))
+            return -1;
+        remaining -= zeros;
+        for(; zeros > 0; --zeros)
+            *out++ = T(0);
+
+        uint32_t nonzeros = reader.get();
+        if(reader.error() || (nonzeros > remaining))
+            return -1;
+        remaining -= nonzeros;
+        for(; nonzeros > 0; --nonzeros)
+        {
+            uint32_t positive = reader.get();
+            if(reader.error())
+                return -1;
+            int32_t current = previous
+                + int32_t((positive >> 1) ^ (0u - (positive & 1)));
+            if((current <= 0) || (current > 65535))
+                return -1;
+            *out++ = T(current);
+            previous = current;
+        }
+    }
+    return 0;
+}
+
+static size_t freenect2_rvl_max_encoded_size(size_t n_pixels)
+{
+    // A pixel costs at most 8 nibbles: a zero run and valid run of length 1
+    // and a 17-bit difference
+    return 4 * n_pixels + 8;
+}
+
+static size_t freenect2_rvl_encode_u16(
+    const uint16_t* in, size_t n_pixels, void* out, size_t out_len)
+{
+    return rvl_encode(in, n_pixels, reinterpret_cast<uint8_t*>(out), out_len);
+}
+
+static size_t freenect2_rvl_encode_float(
+    const float* in, size_t n_pixels, void* out, size_t out_len)
+{
+    return rvl_encode(in, n_pixels, reinterpret_cast<uint8_t*>(out), out_len);
+}
+
+static int freenect2_rvl_decode_u16(
+    const void* in, size_t in_len, uint16_t* out, size_t n_pixels)
+{
+    return rvl_decode(
+        reinterpret_cast<const uint8_t*>(in), in_len, out, n_pixels);
+}
+
+static int freenect2_rvl_decode_float(
+    const void* in, size_t in_len, float* out, size_t n_pixels)
+{
+    return rvl_decode(
+        reinterpret_cast<const uint8_t*>(in), in_len, out, n_pixels);
+}
+
+// Convert BGRX or RGBX color to packed RGB or to 8-bit gray, averaging
+// factor x factor blocks of input pixels into each output pixel. Gray uses
+// the ITU-R BT.601 luma weights in 8-bit fixed point. Any rows or columns
+// beyond a whole number of blocks are ignored.
+
+template<bool Gray>
+static void convert_color(
+    const uint8_t* in, size_t width, size_t height, int rgbx, size_t factor,
+    uint8_t* out)
+{
+    const size_t out_width = width / factor, out_height = height / factor;
+    const size_t r_idx = rgbx ? 0 : 2, b_idx = rgbx ? 2 : 0;
+    const uint32_t n = uint32_t(factor * factor), half = n / 2;
+
+    for(size_t oy=0; oy<out_height; ++oy)
+    {
+        const uint8_t* row = in + oy * factor * width * 4;
+        for(size_t ox=0; ox<out_width; ++ox)
+        {
+            uint32_t r = 0, g = 0, b = 0;
+            if(factor == 1)
+            {
+                const uint8_t* p = row + ox * 4;
+                r = p[r_idx];
+                g = p[1];
+                b = p[b_idx];
+            }
+            else
+            {
+                for(size_t dy=0; dy<factor; ++dy)
+                {
+                    const uint8_t* p = row + (dy * width + ox * factor) * 4;
+                    for(size_t dx=0; dx<factor; ++dx, p += 4)
+                    {
+                        r += p[r_idx];
+                        g += p[1];
+                        b += p[b_idx];
+                    }
+                }
+                r = (r + half) / n;
+                g = (g + half) / n;
+                b = (b + half) / n;
+            }
+
+            if(Gray)
+            {
+                *out++ = uint8_t((77 * r + 150 * g + 29 * b + 128) >> 8);
+            }
+            else
+            {
+                *out++ = uint8_t(r);
+                *out++ = uint8_t(g);
+                *out++ = uint8_t(b);
+            }
+        }
+    }
+}
+
+static void freenect2_color_to_rgb(
+    const void* in, size_t width, size_t height, int rgbx, size_t factor,
+    void* out)
+{
+    convert_color<false>(
+        reinterpret_cast<const uint8_t*>(in), width, height, rgbx, factor,
+        reinterpret_cast<uint8_t*>(out));
+}
+
+static void freenect2_color_to_gray(
+    const void* in, size_t width, size_t height, int rgbx, size_t factor,
+    void* out)
+{
+    convert_color<true>(
+        reinterpret_cast<const uint8_t*>(in), width, height, rgbx, factor,
+        reinterpret_cast<uint8_t*>(out));
+}
@@ -37,6 +37,15 @@ typedef void *Freenect2FrameRef;
 typedef void *Freenect2FrameListenerRef;
 typedef void *Freenect2RegistrationRef;
 
+typedef struct {
+    size_t width, height, bytes_per_pixel;
+    void* data;
+    uint32_t timestamp, sequence;
+    float exposure, gain, gamma;
+    uint32_t status;
+    Freenect2FrameFormat format;
+} Freenect2FrameInfo;
+
 typedef struct {
     float fx, fy, cx, cy, k1, k2, k3, p1, p2;
     ...;
@@ -72,6 +81,8 @@ typedef struct {
 Freenect2Ref freenect2_create(void);
 void freenect2_dispose(Freenect2Ref fn2_ref);
 int freenect2_enumerate_devices(Freenect2Ref fn2_ref);
+size_t freenect2_get_device_serial_number(
+    Freenect2Ref fn2_ref, int index, char* out, size_t out_len);
 
 Freenect2DeviceRef freenect2_open_default_device(Freenect2Ref fn2_ref);
 Freenect2DeviceRef freenect2_open_device_by_index(
@@ -79,7 +90,11 @@ Freenect2DeviceRef freenect2_open_device_by_index(
 Freenect2DeviceRef freenect2_open_device_by_serial(
     Freenect2Ref fn2_ref, const char* serial);
 
+size_t freenect2_device_get_serial_number(
+    Freenect2DeviceRef device_ref, char* out, size_t out_len);
 int freenect2_device_start(Freenect2DeviceRef device_ref);
+int freenect2_device_start_streams(
+    Freenect2DeviceRef device_ref, int rgb, int depth);
 int freenect2_device_stop(Freenect2DeviceRef device_ref);
 int freenect2_device_close(Freenect2DeviceRef device_ref);
 void freenect2_device_set_color_frame_listener(
@@ -94,16 +109,32 @@ ColorCameraParams freenect2_device_get_color_camera_params(
 typedef int (*Freenect2FrameListenerFunc) (
     Freenect2FrameType type, Freenect2FrameRef frame, void *user_data);
 Freenect2FrameListenerRef freenect2_frame_listener_create(
-    Freenect2FrameListenerFunc func, void* user_data);
+    Freenect2FrameListenerFunc func, void* user_data, size_t pool_size);
 void freenect2_frame_listener_dispose(Freenect2FrameListenerRef fl_ref);
+void freenect2_frame_listener_set_decimation(
+    Freenect2FrameListenerRef fl_ref, Freenect2FrameType type,
+    unsigned int every);
 
 extern "Python" int frame_listener_callback(
     Freenect2FrameType type, Freenect2FrameRef frame, void *user_data);
 
+Freenect2FrameListenerRef freenect2_ring_frame_listener_create(
+    size_t capacity, int drop_oldest, size_t pool_size);
+void freenect2_ring_frame_listener_dispose(Freenect2FrameListenerRef fl_ref);
+size_t freenect2_ring_frame_listener_drain(
+    Freenect2FrameListenerRef fl_ref, Freenect2FrameType* types,
+    Freenect2FrameRef* frames, size_t max_frames, double timeout);
+uint64_t freenect2_ring_frame_listener_get_dropped(
+    Freenect2FrameListenerRef fl_ref, Freenect2FrameType type);
+
 Freenect2FrameRef freenect2_frame_create(
     size_t width, size_t height, size_t bytes_per_pixel);
+Freenect2FrameRef freenect2_frame_create_with_data(
+    size_t width, size_t height, size_t bytes_per_pixel, void* data);
 void freenect2_frame_dispose(Freenect2FrameRef frame_ref);
 
+void freenect2_frame_get_info(
+    Freenect2FrameRef frame_ref, Freenect2FrameInfo* info);
 size_t freenect2_frame_get_width(Freenect2FrameRef frame_ref);
 size_t freenect2_frame_get_height(Freenect2FrameRef frame_ref);
 size_t freenect2_frame_get_bytes_per_pixel(Freenect2FrameRef frame_ref);
@@ -135,10 +166,35 @@ void freenect2_registration_apply(
     Freenect2FrameRef depth_ref, Freenect2FrameRef undistorted_ref,
     Freenect2FrameRef registered_ref, int enable_filter,
     Freenect2FrameRef big_depth_ref);
+void freenect2_registration_undistort_depth(
+    Freenect2RegistrationRef reg_ref, Freenect2FrameRef depth_ref,
+    Freenect2FrameRef undistorted_ref);
 void freenect2_registration_get_points_xyz(
     Freenect2RegistrationRef reg_ref, Freenect2FrameRef undistorted_ref,
     const int32_t* rows, const int32_t* cols, size_t n_points,
     float* out_xs, float* out_ys, float* out_zs);
+
+size_t freenect2_lzf_compress(
+    const void* in_data, size_t in_len, void* out_data, size_t out_len);
+size_t freenect2_lzf_decompress(
+    const void* in_data, size_t in_len, void* out_data, size_t out_len);
+
+size_t freenect2_rvl_max_encoded_size(size_t n_pixels);
+size_t freenect2_rvl_encode_u16(
+    const uint16_t* in, size_t n_pixels, void* out, size_t out_len);
+size_t freenect2_rvl_encode_float(
+    const float* in, size_t n_pixels, void* out, size_t out_len);
+int freenect2_rvl_decode_u16(
+    const void* in, size_t in_len, uint16_t* out, size_t n_pixels);
+int freenect2_rvl_decode_float(
+    const void* in, size_t in_len, float* out, size_t n_pixels);
+
+void freenect2_color_to_rgb(
+    const void* in, size_t width, size_t height, int rgbx, size_t factor,
+    void* out);
+void freenect2_color_to_gray(
+    const void* in, size_t width, size_t height, int rgbx, size_t factor,
+    void* out);
 ''')
 
 if __name__ == "__main__":
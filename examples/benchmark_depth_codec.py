@@ -0,0 +1,69 @@
+"""
+Measure the compression ratio and speed of the lossless depth codec in
+freenect2.codec and compare it with zlib. Depth frames are read from a
+recording if one is given on the command line or are otherwise synthetic:
+
+    python benchmark_depth_codec.py [capture.fn2]
+
+Speeds are in megabytes of raw float depth per second.
+
+"""
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from freenect2 import FrameType
+from freenect2.codec import decode_depth, encode_depth
+from freenect2.recording import RecordingReader
+from freenect2.replay import ReplayDevice
+
+def load_depth_frames(max_frames=100):
+    if len(sys.argv) > 1:
+        with RecordingReader(sys.argv[1]) as reader:
+            frames = [f for t, f in reader if t is FrameType.Depth]
+        return frames[:max_frames]
+
+    device = ReplayDevice(
+        realtime=False, max_frames=2 * max_frames, queue_size=2 * max_frames)
+    device.start(color=False)
+    frames = [f for t, f in device if t is FrameType.Depth]
+    device.close()
+    return frames
+
+def benchmark(name, frames, encode, decode):
+    raw_size = sum(len(f.data) for f in frames)
+
+    start = time.time()
+    encoded = [encode(f) for f in frames]
+    encode_time = time.time() - start
+
+    start = time.time()
+    for data in encoded:
+        decode(data)
+    decode_time = time.time() - start
+
+    encoded_size = sum(len(data) for data in encoded)
+    print('{:<16} ratio {:6.2f}  encode {:8.1f} MB/s  decode {:8.1f} MB/s'.format(
+        name, raw_size / float(encoded_size),
+        raw_size / encode_time / 1e6, raw_size / decode_time / 1e6))
+
+def main():
+    frames = load_depth_frames()
+    print('{} depth frames'.format(len(frames)))
+
+    out = np.empty((424, 512), dtype=np.float32)
+    benchmark(
+        'RVL', frames, encode_depth, lambda data: decode_depth(data, out=out))
+    benchmark(
+        'zlib float', frames, lambda f: zlib.compress(f.data, 1),
+        zlib.decompress)
+    benchmark(
+        'zlib uint16 mm', frames,
+        lambda f: zlib.compress(
+            np.round(np.nan_to_num(f.to_array())).astype(np.uint16), 1),
+        zlib.decompress)
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,13 @@
 import json
-from freenect2 import Device, FrameType
+from freenect2 import Device
 import numpy as np
 
 def main():
     device = Device()
-    frames = {}
     with device.running():
-        for type_, frame in device:
-            frames[type_] = frame
-            if FrameType.Color in frames and FrameType.Depth in frames:
-                break
+        frame_set = next(device.framesets())
 
-    rgb, depth = frames[FrameType.Color], frames[FrameType.Depth]
+    rgb, depth = frame_set.color, frame_set.depth
     undistorted, registered, big_depth = device.registration.apply(
         rgb, depth, with_big_depth=True)
 
@@ -20,12 +16,8 @@ def main():
 
     with open('output_calib.json', 'w') as fobj:
         json.dump({
-            'color': dict(
-                (k, getattr(device.color_camera_params, k))
-                for k in 'fx fy cx cy'.split()),
-            'ir': dict(
-                (k, getattr(device.ir_camera_params, k))
-                for k in 'fx fy cx cy k1 k2 k3 p1 p2'.split()),
+            'color': device.color_camera_params.to_dict(),
+            'ir': device.ir_camera_params.to_dict(),
         }, fobj)
 
 if __name__ == '__main__':
@@ -5,21 +5,17 @@ the libpcl PCD format. View the resulting cloud with:
     pcl_viewer output.pcd
 
 """
-from freenect2 import Device, FrameType
+from freenect2 import Device
 import numpy as np
 
-# Open the default device and capture a color and depth frame.
+# Open the default device and capture a matching color and depth frame.
 device = Device()
-frames = {}
 with device.running():
-    for type_, frame in device:
-        frames[type_] = frame
-        if FrameType.Color in frames and FrameType.Depth in frames:
-            break
+    frame_set = next(device.framesets())
 
 # Use the factory calibration to undistort the depth frame and register the RGB
 # frame onto it.
-rgb, depth = frames[FrameType.Color], frames[FrameType.Depth]
+rgb, depth = frame_set.color, frame_set.depth
 undistorted, registered, big_depth = device.registration.apply(
     rgb, depth, with_big_depth=True)
 
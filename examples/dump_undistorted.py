@@ -1,16 +1,12 @@
-from freenect2 import Device, FrameType
+from freenect2 import Device
 import numpy as np
 
 def main():
     device = Device()
-    frames = {}
     with device.running():
-        for type_, frame in device:
-            frames[type_] = frame
-            if FrameType.Color in frames and FrameType.Depth in frames:
-                break
+        frame_set = next(device.framesets())
 
-    rgb, depth = frames[FrameType.Color], frames[FrameType.Depth]
+    rgb, depth = frame_set.color, frame_set.depth
     undistorted, registered = device.registration.apply(rgb, depth)
     points_array = device.registration.get_points_xyz_array(undistorted)
 
@@ -1,8 +1,18 @@
 from __future__ import print_function
 
+import bisect
+from collections import OrderedDict, deque
 from contextlib import contextmanager
 import enum
-from queue import Queue, Empty
+import functools
+import math
+from queue import Empty
+import struct
+import threading
+import time
+import traceback
+import warnings
+import weakref
 
 import numpy as np
 from PIL import Image
@@ -12,10 +22,20 @@ from ._freenect2 import lib, ffi
 __all__ = (
     'NoDeviceError',
     'NoFrameReceivedError',
+    'enumerate_devices',
     'Device',
+    'DeviceGroup',
     'FrameType',
     'FrameFormat',
     'Frame',
+    'FrameSet',
+    'DropPolicy',
+    'QueueFrameListener',
+    'NativeFrameListener',
+    'SyncFrameListener',
+    'CaptureStats',
+    'StreamStats',
+    'CALLBACK_DURATION_BUCKETS',
     'Registration',
     'IrCameraParams',
     'ColorCameraParams'
@@ -31,8 +51,32 @@ def _get_freenect2():
         lib.freenect2_enumerate_devices(_FREENECT2_SINGLETON)
     return _FREENECT2_SINGLETON
 
+def _read_string(read, size=64):
+    """Call *read* with a char buffer and its length and return the string it
+    wrote. *read* returns the untruncated length of the string."""
+    buf = ffi.new('char[]', size)
+    length = read(buf, size)
+    if length >= size:
+        buf = ffi.new('char[]', length + 1)
+        read(buf, length + 1)
+    return ffi.string(buf).decode('ascii')
+
+def enumerate_devices():
+    """Return a list of the serial numbers of the connected devices. The
+    position of each serial number in the list is the index which may be passed
+    to :py:class:`.Device`.
+
+    """
+    fn2 = _get_freenect2()
+    n_devices = lib.freenect2_enumerate_devices(fn2)
+    return [
+        _read_string(lambda buf, size: lib.freenect2_get_device_serial_number(
+            fn2, idx, buf, size))
+        for idx in range(n_devices)
+    ]
+
 class NoDeviceError(RuntimeError):
-    """Raised by :py:class:`.Device` when there is no default device to open."""
+    """Raised by :py:class:`.Device` when there is no device to open."""
     pass
 
 class FrameType(enum.Enum):
@@ -69,7 +113,14 @@ class FrameFormat(enum.Enum):
     #: 1 byte of gray per pixel
     Gray = lib.FRAME_FORMAT_GRAY
 
-@ffi.def_extern()
+def _frame_listener_error(exception, exc_value, tb):
+    # The frame is owned by a Python Frame object as soon as it has been
+    # wrapped and so libfreenect2 must be told that it has been taken even if
+    # the listener raised an exception.
+    traceback.print_exception(exception, exc_value, tb)
+    return 1
+
+@ffi.def_extern(onerror=_frame_listener_error)
 def frame_listener_callback(type_, frame_ref, user_data):
     callable_ = ffi.from_handle(user_data)
     assert callable(callable_)
@@ -77,32 +128,673 @@ def frame_listener_callback(type_, frame_ref, user_data):
     callable_(FrameType(type_), frame)
     return 1
 
-def _callable_to_frame_listener(callable_):
+def _callable_to_frame_listener(callable_, pool_size=0):
     assert callable(callable_)
     handle = ffi.new_handle(callable_)
     return handle, ffi.gc(
-        lib.freenect2_frame_listener_create(lib.frame_listener_callback, handle),
+        lib.freenect2_frame_listener_create(
+            lib.frame_listener_callback, handle, pool_size),
         lib.freenect2_frame_listener_dispose
     )
 
+def _to_frame_listener(value, stats=None, pool_size=0):
+    """Return a (handle, listener) pair suitable for passing to libfreenect2
+    for a listener callable or a :py:class:`.NativeFrameListener`. If *stats*
+    is not-None, calls to a callable are recorded in that
+    :py:class:`.CaptureStats`. Frames passed to a callable are copied into a
+    pool keeping up to *pool_size* idle buffers if *pool_size* is
+    positive."""
+    if isinstance(value, NativeFrameListener):
+        return None, value._c_object
+    if stats is not None:
+        value = functools.partial(stats._deliver, value)
+    return _callable_to_frame_listener(value, pool_size)
+
 class NoFrameReceivedError(RuntimeError):
     """With the default frame listener this is raised when no frame has been
     received from the device within a set time."""
     pass
 
+class DropPolicy(enum.Enum):
+    """What a bounded frame queue does with a new item when it is full."""
+
+    #: Discard the oldest queued item to make room for the new one.
+    DropOldest = 'drop-oldest'
+
+    #: Discard the new item and leave the queue unchanged.
+    DropNewest = 'drop-newest'
+
+    #: Queue at most one item of each kind, replacing any queued item of the
+    #: same kind with the new one. For frame queues the kind is the
+    #: :py:class:`.FrameType`.
+    KeepLatest = 'keep-latest'
+
+# Timeouts are measured with a monotonic clock so that changes to the system
+# clock do not affect them. time.monotonic is not available under Python 2.
+_monotonic = getattr(time, 'monotonic', time.time)
+
+class _DropQueue(object):
+    """A thread-safe bounded FIFO which, rather than blocking or raising an
+    exception when full, discards an item according to a
+    :py:class:`.DropPolicy`. Each item is put with a key which identifies its
+    kind for :py:attr:`.DropPolicy.KeepLatest` and for drop accounting.
+
+    .. py:attribute:: dropped
+
+        (dict) A mapping from key to the number of items with that key which
+        have been discarded.
+
+    """
+    def __init__(self, maxsize, policy=DropPolicy.DropOldest):
+        self.maxsize = maxsize
+        self.policy = DropPolicy(policy)
+        self.dropped = {}
+        self._items = deque()
+        self._not_empty = threading.Condition(threading.Lock())
+
+    def put(self, item, key=None):
+        """Append *item* to the queue. Returns the item which was discarded to
+        make room or None if nothing was discarded."""
+        with self._not_empty:
+            dropped = None
+            if self.policy is DropPolicy.KeepLatest:
+                for idx, (queued_key, _) in enumerate(self._items):
+                    if queued_key == key:
+                        dropped = self._items[idx]
+                        del self._items[idx]
+                        break
+            if dropped is None and self.maxsize > 0 and (
+                    len(self._items) >= self.maxsize):
+                if self.policy is DropPolicy.DropNewest:
+                    dropped = (key, item)
+                else:
+                    dropped = self._items.popleft()
+            if dropped is not None:
+                self.dropped[dropped[0]] = self.dropped.get(dropped[0], 0) + 1
+                if dropped[1] is item:
+                    return item
+            self._items.append((key, item))
+            self._not_empty.notify()
+            return None if dropped is None else dropped[1]
+
+    def get(self, block=True, timeout=None):
+        """Remove and return the oldest item. Raises :py:class:`queue.Empty` if
+        no item is available within *timeout* seconds."""
+        with self._not_empty:
+            if block:
+                deadline = None if timeout is None else _monotonic() + timeout
+                while not self._items:
+                    if deadline is None:
+                        self._not_empty.wait()
+                        continue
+                    remaining = deadline - _monotonic()
+                    if remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+            if not self._items:
+                raise Empty()
+            return self._items.popleft()[1]
+
+    def qsize(self):
+        """Number of items currently queued."""
+        return len(self._items)
+
+    # The read-only part of the queue.Queue interface for code which used
+    # QueueFrameListener.queue when it was a queue.Queue.
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self):
+        return self.maxsize > 0 and self.qsize() >= self.maxsize
+
+    def get_nowait(self):
+        return self.get(False)
+
 class QueueFrameListener(object):
-    def __init__(self, maxsize=16):
-        self.queue = Queue(maxsize=maxsize)
+    """A frame listener which queues frames for retrieval by another thread.
+    This is the default listener used by :py:class:`.Device`.
+
+    The queue never blocks the thread delivering frames. If the consumer falls
+    behind, frames are discarded according to *policy* and counted in
+    :py:attr:`.dropped`.
+
+    Args:
+        maxsize (int): the maximum number of frames queued.
+        policy (:py:class:`.DropPolicy`): what to do with a new frame if the
+            queue is full. With :py:attr:`.DropPolicy.KeepLatest` at most one
+            frame of each :py:class:`.FrameType` is queued and consumers always
+            receive the most recent frame of each type.
+
+    """
+    def __init__(self, maxsize=16, policy=DropPolicy.DropOldest):
+        self._queue = _DropQueue(maxsize, policy)
 
     def __call__(self, frame_type, frame):
-        self.queue.put_nowait((frame_type, frame))
+        self._queue.put((frame_type, frame), frame_type)
 
     def get(self, timeout=False):
-        return self.queue.get(True, timeout)
+        return self._queue.get(True, timeout)
+
+    def qsize(self):
+        """The number of frames currently queued."""
+        return self._queue.qsize()
+
+    @property
+    def policy(self):
+        """The :py:class:`.DropPolicy` used when the queue is full."""
+        return self._queue.policy
+
+    @property
+    def queue(self):
+        """The queue of frame type, frame tuples. It supports the ``get``,
+        ``get_nowait``, ``qsize``, ``empty`` and ``full`` methods of
+        :py:class:`queue.Queue` but frames may only be added by calling the
+        listener.
+
+        This property is deprecated. Use :py:meth:`.get` and :py:meth:`.qsize`
+        instead.
+
+        """
+        warnings.warn(
+            'QueueFrameListener.queue is deprecated; use get() and qsize()',
+            DeprecationWarning, stacklevel=2)
+        return self._queue
+
+    @property
+    def dropped(self):
+        """A dict mapping each :py:class:`.FrameType` to the number of frames
+        of that type which have been discarded."""
+        dropped = dict((t, 0) for t in FrameType)
+        dropped.update(self._queue.dropped)
+        return dropped
+
+def _timestamp_delta(a, b):
+    """Signed difference between two 32-bit frame timestamps allowing for
+    wrap-around."""
+    delta = (a - b) & 0xffffffff
+    return delta - 0x100000000 if delta >= 0x80000000 else delta
+
+# Seconds Device.get_frames waits on each of several NativeFrameListeners
+# before checking the others.
+_DRAIN_POLL_INTERVAL = 0.005
+
+class NativeFrameListener(object):
+    """A frame listener implemented in the C binding. Frames are stored in a
+    fixed-capacity ring buffer as they arrive without calling into Python and
+    so libfreenect2's threads never need to acquire the GIL. Frames are
+    retrieved in batches with :py:meth:`.drain` or
+    :py:meth:`.Device.get_frames`.
+
+    Color frames and IR/depth frames are each stored in a separate ring of
+    *capacity* frames. Frames must be retrieved by a single thread.
+
+    Instances may be assigned to :py:attr:`.Device.color_frame_listener` and
+    :py:attr:`.Device.ir_and_depth_frame_listener` or passed to
+    :py:meth:`.Device.start` in place of a callable.
+
+    Args:
+        capacity (int): number of frames each ring can hold.
+        policy (:py:class:`.DropPolicy`): what to do with a new frame if the
+            ring is full. :py:attr:`.DropPolicy.KeepLatest` is not supported.
+        pool_size (int): the number of idle frame buffers kept for re-use.
+            Pooled frames are copied on libfreenect2's thread. See
+            :py:class:`.Device`. Zero disables pooling and the copy.
 
-class ColorCameraParams(object):
     """
-    Color camera intrinsic calibration.
+    def __init__(self, capacity=8, policy=DropPolicy.DropOldest, pool_size=4):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        policy = DropPolicy(policy)
+        if policy is DropPolicy.KeepLatest:
+            raise ValueError('KeepLatest policy is not supported')
+        self.capacity = capacity
+        self.policy = policy
+        # The frame filter set by the device which last configured this
+        # listener. See Device.set_frame_filter.
+        self._frame_filter = dict((t, 1) for t in FrameType)
+        self._filter_device = lambda: None
+        self._c_object = ffi.gc(
+            lib.freenect2_ring_frame_listener_create(
+                capacity, 1 if policy is DropPolicy.DropOldest else 0,
+                pool_size),
+            lib.freenect2_ring_frame_listener_dispose)
+        self._types = ffi.new('Freenect2FrameType[]', 2 * capacity)
+        self._frames = ffi.new('Freenect2FrameRef[]', 2 * capacity)
+
+    def drain(self, max_frames=None, timeout=None):
+        """Wait for frames to arrive and return all those currently stored.
+
+        The GIL is released while waiting. Only one thread may drain a
+        listener at a time.
+
+        Args:
+            max_frames (int or None): if not-None, the maximum number of
+                frames to return.
+            timeout (number or None): if not-None, the maximum number of
+                seconds to wait for a frame. Zero means do not wait.
+
+        Returns:
+            A list of :py:class:`.FrameType`, :py:class:`.Frame` tuples. The
+            list is empty if no frame arrived within *timeout* seconds.
+
+        """
+        if max_frames is None or max_frames > 2 * self.capacity:
+            max_frames = 2 * self.capacity
+        n_frames = lib.freenect2_ring_frame_listener_drain(
+            self._c_object, self._types, self._frames, max_frames,
+            -1.0 if timeout is None else timeout)
+        return [
+            (FrameType(self._types[idx]),
+             Frame(ffi.gc(self._frames[idx], lib.freenect2_frame_dispose)))
+            for idx in range(n_frames)
+        ]
+
+    @property
+    def dropped(self):
+        """A dict mapping each :py:class:`.FrameType` to the number of frames
+        of that type which have been discarded."""
+        return dict(
+            (t, lib.freenect2_ring_frame_listener_get_dropped(
+                self._c_object, t.value))
+            for t in FrameType)
+
+class FrameSet(object):
+    """A group of frames of different types captured at the same instant.
+    Frame sets are produced by :py:class:`.SyncFrameListener` and
+    :py:meth:`.Device.framesets`.
+
+    Individual frames may be retrieved by indexing with a
+    :py:class:`.FrameType` or via the :py:attr:`.color`, :py:attr:`.depth` and
+    :py:attr:`.ir` attributes.
+
+    .. py:attribute:: frames
+
+        (dict) A mapping from :py:class:`.FrameType` to :py:class:`.Frame`.
+
+    """
+    def __init__(self, frames):
+        self.frames = dict(frames)
+
+    def __getitem__(self, frame_type):
+        return self.frames[frame_type]
+
+    def __contains__(self, frame_type):
+        return frame_type in self.frames
+
+    @property
+    def color(self):
+        """The color :py:class:`.Frame` or None if not part of this set."""
+        return self.frames.get(FrameType.Color)
+
+    @property
+    def depth(self):
+        """The depth :py:class:`.Frame` or None if not part of this set."""
+        return self.frames.get(FrameType.Depth)
+
+    @property
+    def ir(self):
+        """The IR :py:class:`.Frame` or None if not part of this set."""
+        return self.frames.get(FrameType.Ir)
+
+    def __repr__(self):
+        return 'FrameSet({!r})'.format(self.frames)
+
+class SyncFrameListener(object):
+    """A frame listener which groups frames captured at the same instant into
+    :py:class:`.FrameSet` instances.
+
+    Frames are matched by :py:attr:`.Frame.timestamp`. IR and depth frames are
+    decoded from the same packet and so share a timestamp. Each newly arrived
+    frame is matched with the closest pending frame of every other required
+    type. Pending frames older than a completed set can never be matched and
+    are discarded.
+
+    Args:
+        frame_types (sequence): the :py:class:`.FrameType` values which each
+            frame set must contain. Frames of other types are ignored.
+        tolerance (int): the largest difference in timestamp between frames in
+            a set. Timestamps are in units of roughly 0.1 milliseconds.
+        maxsize (int): the maximum number of complete frame sets which are
+            queued waiting for :py:meth:`.get`.
+        policy (:py:class:`.DropPolicy`): what to do with a new frame set if
+            *maxsize* sets are already queued. With
+            :py:attr:`.DropPolicy.KeepLatest` only the most recent set is
+            kept.
+        max_pending (int): the maximum number of unmatched frames held per
+            frame type.
+
+    .. py:attribute:: unmatched
+
+        (dict) A mapping from :py:class:`.FrameType` to the number of frames of
+        that type discarded because no matching frames arrived.
+
+    """
+    def __init__(self, frame_types=(FrameType.Color, FrameType.Depth),
+                 tolerance=160, maxsize=4, policy=DropPolicy.DropOldest,
+                 max_pending=4):
+        self.frame_types = tuple(FrameType(t) for t in frame_types)
+        self.tolerance = tolerance
+        self.unmatched = dict((t, 0) for t in self.frame_types)
+        self._pending = dict(
+            (t, deque(maxlen=max_pending)) for t in self.frame_types)
+        self._lock = threading.Lock()
+        self._queue = _DropQueue(maxsize, policy)
+
+    def __call__(self, frame_type, frame):
+        if frame_type not in self._pending:
+            return
+
+        timestamp = frame.timestamp
+        with self._lock:
+            pending = self._pending[frame_type]
+            if len(pending) == pending.maxlen:
+                self.unmatched[frame_type] += 1
+            pending.append((timestamp, frame))
+
+            match = {frame_type: frame}
+            for other_type in self.frame_types:
+                if other_type is frame_type:
+                    continue
+                best, best_delta = None, None
+                for other_timestamp, other in self._pending[other_type]:
+                    delta = abs(_timestamp_delta(other_timestamp, timestamp))
+                    if delta <= self.tolerance and (
+                            best is None or delta < best_delta):
+                        best, best_delta = other, delta
+                if best is None:
+                    return
+                match[other_type] = best
+
+            # Matched frames and anything which arrived before them are no
+            # longer pending.
+            for matched_type, matched in match.items():
+                pending = self._pending[matched_type]
+                while pending:
+                    _, candidate = pending.popleft()
+                    if candidate is matched:
+                        break
+                    self.unmatched[matched_type] += 1
+
+        self._queue.put(FrameSet(match))
+
+    def get(self, timeout=None):
+        """Return the next complete :py:class:`.FrameSet`. Raises
+        :py:class:`queue.Empty` if none arrives within *timeout* seconds."""
+        return self._queue.get(True, timeout)
+
+    def qsize(self):
+        """The number of complete frame sets currently queued."""
+        return self._queue.qsize()
+
+    @property
+    def dropped(self):
+        """(int) Number of complete frame sets discarded because the queue was
+        full."""
+        return sum(self._queue.dropped.values())
+
+#: Upper bounds, in seconds, of the buckets of the listener call duration
+#: histogram kept by :py:class:`.StreamStats`. A final bucket counts calls
+#: longer than the last bound.
+CALLBACK_DURATION_BUCKETS = (
+    50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3)
+
+# time.perf_counter is not available under Python 2.
+_perf_counter = getattr(time, 'perf_counter', time.time)
+
+class StreamStats(object):
+    """Capture statistics for frames of a single :py:class:`.FrameType`.
+    Instances are obtained from :py:attr:`.Device.stats`.
+
+    Updating the statistics costs a handful of arithmetic operations per frame.
+    Frame rate and jitter are computed from :py:attr:`.Frame.timestamp` and so
+    measure the device rather than the scheduling of the receiving thread.
+
+    .. py:attribute:: frame_type
+
+        (:py:class:`.FrameType`) The type of frame described.
+
+    .. py:attribute:: received
+
+        (int) Number of frames delivered to the listener.
+
+    .. py:attribute:: sequence_gaps
+
+        (int) Number of times a frame's :py:attr:`.Frame.sequence` did not
+        follow on from the previous frame.
+
+    .. py:attribute:: missed_frames
+
+        (int) Total number of sequence numbers skipped in those gaps, not
+        counting frames removed by :py:meth:`.Device.set_frame_filter`. These
+        frames never reached the listener.
+
+    .. py:attribute:: callback_durations
+
+        (list) Number of listener calls whose duration fell in each bucket of
+        :py:data:`.CALLBACK_DURATION_BUCKETS`. The list has one more entry than
+        there are bounds. Frames retrieved via :py:meth:`.Device.get_frames`
+        involve no listener call and are not counted.
+
+    """
+    def __init__(self, frame_type, listener_for=None):
+        self.frame_type = FrameType(frame_type)
+        self._listener_for = listener_for
+        self._sequence_step = 1
+        self.reset()
+
+    def reset(self):
+        """Set all counters to zero."""
+        self.received = 0
+        self.sequence_gaps = 0
+        self.missed_frames = 0
+        self.callback_durations = [0] * (len(CALLBACK_DURATION_BUCKETS) + 1)
+        self.max_callback_duration = 0.0
+        self._last_sequence = None
+        self._last_timestamp = None
+        self._n_intervals = 0
+        self._interval_mean = 0.0
+        self._interval_m2 = 0.0
+
+    def _record(self, frame, duration=None):
+        self.received += 1
+
+        sequence, timestamp = frame.sequence, frame.timestamp
+        last_sequence = self._last_sequence
+        step = self._sequence_step
+        if last_sequence is not None and sequence != last_sequence + step:
+            self.sequence_gaps += 1
+            if sequence > last_sequence + step:
+                self.missed_frames += sequence - last_sequence - step
+        self._last_sequence = sequence
+
+        # Running mean and variance of the interval between frames using
+        # Welford's method.
+        if self._last_timestamp is not None:
+            interval = 1e-4 * _timestamp_delta(timestamp, self._last_timestamp)
+            self._n_intervals += 1
+            delta = interval - self._interval_mean
+            self._interval_mean += delta / self._n_intervals
+            self._interval_m2 += delta * (interval - self._interval_mean)
+        self._last_timestamp = timestamp
+
+        if duration is not None:
+            self.callback_durations[
+                bisect.bisect_left(CALLBACK_DURATION_BUCKETS, duration)] += 1
+            if duration > self.max_callback_duration:
+                self.max_callback_duration = duration
+
+    @property
+    def fps(self):
+        """(float) Mean frame rate in frames per second or zero if fewer than
+        two frames have been received."""
+        if self._interval_mean <= 0:
+            return 0.0
+        return 1.0 / self._interval_mean
+
+    @property
+    def jitter(self):
+        """(float) Standard deviation of the interval between consecutive
+        frames in seconds."""
+        if self._n_intervals == 0:
+            return 0.0
+        return math.sqrt(self._interval_m2 / self._n_intervals)
+
+    def _listener(self):
+        return None if self._listener_for is None else self._listener_for(
+            self.frame_type)
+
+    @property
+    def dropped(self):
+        """(int) Number of frames of this type discarded by the installed
+        listener or zero if the listener does not count them per type."""
+        dropped = getattr(self._listener(), 'dropped', None)
+        if not isinstance(dropped, dict):
+            return 0
+        return dropped.get(self.frame_type, 0)
+
+    @property
+    def queue_depth(self):
+        """(int or None) Number of items currently queued in the installed
+        listener or None if the listener does not report it. The queue may be
+        shared with other frame types."""
+        qsize = getattr(self._listener(), 'qsize', None)
+        return None if qsize is None else qsize()
+
+    def to_dict(self):
+        """Return the statistics as a dict of plain Python values."""
+        return {
+            'received': self.received,
+            'dropped': self.dropped,
+            'sequence_gaps': self.sequence_gaps,
+            'missed_frames': self.missed_frames,
+            'fps': self.fps,
+            'jitter': self.jitter,
+            'queue_depth': self.queue_depth,
+            'callback_duration_buckets': list(CALLBACK_DURATION_BUCKETS),
+            'callback_durations': list(self.callback_durations),
+            'max_callback_duration': self.max_callback_duration,
+        }
+
+class CaptureStats(object):
+    """Per-stream capture statistics for a device. Index with a
+    :py:class:`.FrameType` to get the :py:class:`.StreamStats` for that type.
+
+    .. code::
+
+        with device.running():
+            # ... capture ...
+            print(device.stats[FrameType.Depth].fps)
+            json.dump(device.stats.to_dict(), log_file)
+
+    Each stream is only updated from the thread which delivers its frames and
+    so no lock is taken. Values read from other threads may be one frame
+    stale.
+
+    """
+    def __init__(self, listener_for=None):
+        self._streams = dict(
+            (t, StreamStats(t, listener_for)) for t in FrameType)
+
+    def __getitem__(self, frame_type):
+        return self._streams[FrameType(frame_type)]
+
+    def reset(self):
+        """Set all counters to zero."""
+        for stream in self._streams.values():
+            stream.reset()
+
+    def _deliver(self, listener, frame_type, frame):
+        """Call *listener* with *frame_type* and *frame* and record the
+        frame and the time taken."""
+        start = _perf_counter()
+        try:
+            listener(frame_type, frame)
+        finally:
+            self._streams[frame_type]._record(
+                frame, _perf_counter() - start)
+
+    def to_dict(self):
+        """Return a dict mapping the lower-case name of each
+        :py:class:`.FrameType` to the dict returned by
+        :py:meth:`.StreamStats.to_dict`."""
+        return dict(
+            (t.name.lower(), stream.to_dict())
+            for t, stream in self._streams.items())
+
+class _CameraParams(object):
+    """Base class for camera calibration. Sub-classes set :py:attr:`_fields`
+    to the names of the calibration values and :py:attr:`_c_type` to the
+    corresponding binding structure."""
+    __slots__ = ()
+    _fields = ()
+    _c_type = None
+
+    def __init__(self, **kwargs):
+        for name in self._fields:
+            # Values are held at the single precision used by libfreenect2 so
+            # that equal calibrations compare and hash equal.
+            setattr(self, name, float(np.float32(kwargs.pop(name, 0.0))))
+        if len(kwargs) > 0:
+            raise TypeError('Unknown calibration values: {}'.format(
+                ', '.join(sorted(kwargs))))
+
+    @classmethod
+    def _from_c(cls, c_params):
+        return cls(**dict((name, getattr(c_params, name)) for name in cls._fields))
+
+    @classmethod
+    def _coerce(cls, params):
+        """Return *params* as an instance of this class. *params* may be an
+        instance already or a binding structure."""
+        return params if isinstance(params, cls) else cls._from_c(params)
+
+    def _to_c(self):
+        c_params = ffi.new(self._c_type + '*')
+        for name in self._fields:
+            setattr(c_params, name, getattr(self, name))
+        return c_params[0]
+
+    def to_dict(self):
+        """Return a dict mapping the name of each calibration value to the
+        value. The dict may be serialised as JSON."""
+        return dict((name, getattr(self, name)) for name in self._fields)
+
+    @classmethod
+    def from_dict(cls, d):
+        """Create calibration from a dict returned by :py:meth:`.to_dict`.
+        Missing values are zero."""
+        return cls(**d)
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._values() == other._values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self).__name__,) + self._values())
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name))
+            for name in self._fields))
+
+class ColorCameraParams(_CameraParams):
+    """
+    Color camera intrinsic calibration and the mapping from depth to color
+    pixels. Instances may be compared, hashed, pickled and converted to and
+    from dicts with :py:meth:`.to_dict` and :py:meth:`.from_dict`. Values are
+    passed as keyword arguments to the constructor.
 
     .. py:attribute:: fx
 
@@ -119,11 +811,35 @@ class ColorCameraParams(object):
     .. py:attribute:: cy
 
         Principal point for y-axis (pixels)
+
+    .. py:attribute:: shift_d
+
+        Depth to color mapping shift (divisor)
+
+    .. py:attribute:: shift_m
+
+        Depth to color mapping shift (multiplier)
+
+    The remaining attributes, ``mx_x3y0`` to ``mx_x0y0`` and ``my_x3y0`` to
+    ``my_x0y0``, are the co-efficients of the polynomials mapping depth pixels
+    to color pixels. The suffix gives the powers of *x* and *y* in each term.
     """
+    _fields = (
+        'fx', 'fy', 'cx', 'cy', 'shift_d', 'shift_m',
+        'mx_x3y0', 'mx_x0y3', 'mx_x2y1', 'mx_x1y2', 'mx_x2y0', 'mx_x0y2',
+        'mx_x1y1', 'mx_x1y0', 'mx_x0y1', 'mx_x0y0',
+        'my_x3y0', 'my_x0y3', 'my_x2y1', 'my_x1y2', 'my_x2y0', 'my_x0y2',
+        'my_x1y1', 'my_x1y0', 'my_x0y1', 'my_x0y0',
+    )
+    __slots__ = _fields
+    _c_type = 'ColorCameraParams'
 
-class IrCameraParams(object):
+class IrCameraParams(_CameraParams):
     """
-    IR/depth camera intrinsic calibration.
+    IR/depth camera intrinsic calibration. Instances may be compared, hashed,
+    pickled and converted to and from dicts with :py:meth:`.to_dict` and
+    :py:meth:`.from_dict`. Values are passed as keyword arguments to the
+    constructor.
 
     .. py:attribute:: fx
 
@@ -161,14 +877,37 @@ class IrCameraParams(object):
 
         Tangential distortion co-efficient
     """
+    _fields = ('fx', 'fy', 'cx', 'cy', 'k1', 'k2', 'k3', 'p1', 'p2')
+    __slots__ = _fields
+    _c_type = 'IrCameraParams'
 
 class Device(object):
     """Control a single device.
 
     If called with no arguments, the default device is opened.
 
+    Args:
+        serial (str or None): if not-None, open the device with this serial
+            number.
+        index (int or None): if not-None, open the device with this index in
+            the list returned by :py:func:`.enumerate_devices`.
+        queue_size (int): maximum number of frames held by the default
+            listener waiting for :py:meth:`.get_next_frame`.
+        drop_policy (:py:class:`.DropPolicy`): what the default listener does
+            with new frames when *queue_size* frames are already waiting. See
+            :py:class:`.QueueFrameListener`.
+        pool_size (int): the number of idle frame buffers kept for re-use by
+            each listener. Frames are copied from libfreenect2 into pooled
+            buffers and return to the pool when they are garbage collected or
+            :py:meth:`.Frame.release` is called. Once frames are released as
+            quickly as they arrive no memory is allocated while capturing.
+            The cost is a copy of every frame, about 8 MB for a color frame,
+            on libfreenect2's thread. Zero disables pooling and frames are
+            handed over directly without a copy, at the cost of an allocation
+            per frame.
+
     Raises:
-        :py:class:`.NoDeviceError` if there is no default device to open.
+        :py:class:`.NoDeviceError` if there is no matching device to open.
 
     .. py:attribute:: color_camera_params
 
@@ -184,39 +923,89 @@ class Device(object):
 
     """
 
-    def __init__(self, c_object=None):
+    def __init__(self, c_object=None, serial=None, index=None, queue_size=16,
+                 drop_policy=DropPolicy.DropOldest, pool_size=4):
         if c_object is None:
-            c_object = lib.freenect2_open_default_device(_get_freenect2())
+            if serial is not None:
+                c_object = lib.freenect2_open_device_by_serial(
+                    _get_freenect2(), serial.encode('ascii'))
+            elif index is not None:
+                c_object = lib.freenect2_open_device_by_index(
+                    _get_freenect2(), index)
+            else:
+                c_object = lib.freenect2_open_default_device(_get_freenect2())
         self._c_object = c_object
         if self._c_object == ffi.NULL:
             raise NoDeviceError()
 
+        self._init_capture(queue_size, drop_policy, pool_size)
+
+    def _init_capture(self, queue_size, drop_policy, pool_size):
+        """Set up the state which does not depend on the hardware: the
+        statistics, frame filter, default listener and camera parameters.
+        Subclasses which do not open a device call this in place of
+        :py:meth:`.__init__`."""
         self._registration = None
+        self._stats = CaptureStats(self._listener_for_type)
+        self._pool_size = pool_size
+        self._frame_filter = dict((t, 1) for t in FrameType)
 
-        self._default_listener = QueueFrameListener()
+        self._default_listener = QueueFrameListener(queue_size, drop_policy)
         self.color_frame_listener = self._default_listener
         self.ir_and_depth_frame_listener = self._default_listener
 
         self.color_camera_params = None
         self.ir_camera_params = None
 
-    def start(self, frame_listener=None):
+    @property
+    def serial_number(self):
+        """The serial number of the device."""
+        return _read_string(
+            lambda buf, size: lib.freenect2_device_get_serial_number(
+                self._c_object, buf, size))
+
+    def start(self, frame_listener=None, color=True, depth=True):
         """Start depth, IR and RGB streams.
 
         Args:
             frame_listener (callable or None): if not-None, this is a callable
-                which is assigned to both :py:attr:`.color_frame_listener` and
+                or :py:class:`.NativeFrameListener` which is assigned to both
+                :py:attr:`.color_frame_listener` and
                 :py:attr:`.ir_and_depth_frame_listener` before the device is
                 started.
+            color (bool): if true, start the color stream.
+            depth (bool): if true, start the IR and depth streams.
+
+        Only the listeners for the requested streams are installed. Disabling
+        the color stream avoids decoding color frames entirely, which
+        significantly reduces CPU usage when only depth is required.
 
         """
+        if not color and not depth:
+            raise ValueError('At least one of color or depth must be started')
+
         if frame_listener is not None:
             self.color_frame_listener = frame_listener
             self.ir_and_depth_frame_listener = frame_listener
-        lib.freenect2_device_start(self._c_object)
 
-        self.color_camera_params = lib.freenect2_device_get_color_camera_params(self._c_object)
-        self.ir_camera_params = lib.freenect2_device_get_ir_camera_params(self._c_object)
+        self._frame_filter_changed()
+        lib.freenect2_device_set_color_frame_listener(
+            self._c_object,
+            self._color_frame_listener[2] if color else ffi.NULL)
+        lib.freenect2_device_set_ir_and_depth_frame_listener(
+            self._c_object,
+            self._ir_and_depth_frame_listener[2] if depth else ffi.NULL)
+
+        if color and depth:
+            lib.freenect2_device_start(self._c_object)
+        else:
+            lib.freenect2_device_start_streams(
+                self._c_object, 1 if color else 0, 1 if depth else 0)
+
+        self.color_camera_params = ColorCameraParams._from_c(
+            lib.freenect2_device_get_color_camera_params(self._c_object))
+        self.ir_camera_params = IrCameraParams._from_c(
+            lib.freenect2_device_get_ir_camera_params(self._c_object))
 
     def stop(self):
         """Stop any running streams."""
@@ -253,6 +1042,150 @@ class Device(object):
 
         return frame_type, frame
 
+    def get_frames(self, max_frames=None, timeout=None):
+        """Get a batch of frames from the device.
+
+        This method only works if a :py:class:`.NativeFrameListener` has been
+        installed as :py:attr:`.color_frame_listener` or
+        :py:attr:`.ir_and_depth_frame_listener`. Frames are drained from the
+        listener's ring buffers with the GIL released while waiting.
+
+        .. code::
+
+            with device.running(NativeFrameListener()):
+                while True:
+                    for frame_type, frame in device.get_frames():
+                        # ... process frame ...
+
+        Args:
+            max_frames (int or None): if not-None, the maximum number of
+                frames to return.
+            timeout (number or None): If not-None, a positive number of seconds
+                to wait for a frame before raising a
+                :py:class:`.NoFrameReceivedError` exception.
+
+        Returns:
+            A non-empty list of :py:class:`.FrameType`, :py:class:`.Frame`
+            tuples.
+
+        """
+        listeners = []
+        for listener in (self.color_frame_listener,
+                         self.ir_and_depth_frame_listener):
+            if isinstance(listener, NativeFrameListener) and (
+                    listener not in listeners):
+                listeners.append(listener)
+        if len(listeners) == 0:
+            raise RuntimeError('No NativeFrameListener is installed')
+
+        # A single listener can be waited on directly. Otherwise the streams
+        # may be running on any of the listeners and so wait briefly on each
+        # in turn, collecting whatever is waiting in the others, until a frame
+        # arrives or the timeout expires.
+        deadline = None if timeout is None else _monotonic() + timeout
+        first = 0
+        while True:
+            remaining = (
+                None if deadline is None else max(0, deadline - _monotonic()))
+            if len(listeners) == 1:
+                wait = remaining
+            else:
+                wait = _DRAIN_POLL_INTERVAL if remaining is None else min(
+                    _DRAIN_POLL_INTERVAL, remaining)
+
+            frames = []
+            for offset in range(len(listeners)):
+                if max_frames is not None and len(frames) >= max_frames:
+                    break
+                listener = listeners[(first + offset) % len(listeners)]
+                frames.extend(listener.drain(
+                    None if max_frames is None else max_frames - len(frames),
+                    wait if offset == 0 else 0))
+            if len(frames) > 0 or remaining == 0:
+                break
+            first += 1
+
+        if len(frames) == 0:
+            raise NoFrameReceivedError()
+
+        for frame_type, frame in frames:
+            self._stats[frame_type]._record(frame)
+
+        return frames
+
+    def framesets(self, timeout=None, **kwargs):
+        """Return an iterator over synchronised frame sets from the device.
+
+        Frames are taken from the default listener, as for
+        :py:meth:`.get_next_frame`, and grouped by a
+        :py:class:`.SyncFrameListener`. Any keyword arguments are passed to
+        the :py:class:`.SyncFrameListener` constructor.
+
+        Args:
+            timeout (number or None): If not-None, a positive number of seconds
+                to wait for each frame before raising a
+                :py:class:`.NoFrameReceivedError` exception.
+
+        .. code::
+
+            with device.running():
+                for frame_set in device.framesets():
+                    undistorted, registered = device.registration.apply(
+                        frame_set.color, frame_set.depth)
+
+        """
+        sync = SyncFrameListener(**kwargs)
+        def iterator():
+            while True:
+                sync(*self.get_next_frame(timeout))
+                try:
+                    while True:
+                        yield sync.get(0)
+                except Empty:
+                    pass
+        return iterator()
+
+    def aiter(self, timeout=None):
+        """Return an asynchronous iterator over :py:class:`.FrameType`,
+        :py:class:`.Frame` tuples for use with ``async for``. Requires Python
+        3.5 or later.
+
+        Frames are received by a
+        :py:class:`freenect2.aio.AsyncFrameListener`. If one is not already
+        installed as :py:attr:`.color_frame_listener` or
+        :py:attr:`.ir_and_depth_frame_listener`, one is installed in their
+        place. Since listeners should not be replaced while the device is
+        running, either call this method before :py:meth:`.start` or pass an
+        :py:class:`freenect2.aio.AsyncFrameListener` to :py:meth:`.start`.
+
+        Args:
+            timeout (number or None): If not-None, a positive number of seconds
+                to wait for each frame before raising a
+                :py:class:`.NoFrameReceivedError` exception.
+
+        .. code::
+
+            async for frame_type, frame in device.aiter():
+                # ... process frame ...
+
+        """
+        from .aio import aiter_frames
+        return aiter_frames(self, timeout)
+
+    def next_frame(self, timeout=None):
+        """Coroutine which returns the next :py:class:`.FrameType`,
+        :py:class:`.Frame` tuple from the device. This is the asynchronous
+        equivalent of :py:meth:`.get_next_frame`. See :py:meth:`.aiter` for
+        how frames are received.
+
+        .. code::
+
+            frame_type, frame = await device.next_frame(timeout=1)
+
+        """
+        from .aio import next_frame
+        return next_frame(self, timeout)
+
     @property
     def registration(self):
         """An instance of :py:class:`.Registration` which can be used to
@@ -260,24 +1193,128 @@ class Device(object):
 
         """
         if self._registration is None:
-            self._registration = Registration(
+            self._registration = Registration.from_params(
                 self.ir_camera_params, self.color_camera_params)
         return self._registration
 
+    @property
+    def stats(self):
+        """A :py:class:`.CaptureStats` instance with per-stream counts of
+        received, dropped and missed frames, frame rate, jitter, listener call
+        durations and queue depth. Statistics accumulate across calls to
+        :py:meth:`.start` until :py:meth:`.CaptureStats.reset` is called."""
+        return self._stats
+
+    @property
+    def frame_filter(self):
+        """A dict mapping each :py:class:`.FrameType` to N where every Nth frame
+        of that type is delivered. Zero means no frames of that type are
+        delivered. See :py:meth:`.set_frame_filter`."""
+        return dict(self._frame_filter)
+
+    def set_frame_filter(self, frame_types=None, every=None):
+        """Choose which frames are delivered to the frame listeners.
+
+        Frames are filtered in the binding as they arrive from libfreenect2.
+        Rejected frames are left with libfreenect2 without acquiring the GIL or
+        creating a :py:class:`.Frame` and so cost almost nothing. The filter
+        applies to the installed listeners and to any installed later. The
+        decimation count restarts whenever the filter is set and when the
+        device is started.
+
+        A :py:class:`.NativeFrameListener` holds the filter itself. A listener
+        shared by several devices must therefore be used with the same filter
+        on each. :py:class:`ValueError` is raised if one device would change
+        the filter of a listener which another device is using.
+
+        .. code::
+
+            # Depth at full rate, color at a sixth of the rate and no IR
+            device.set_frame_filter(
+                [FrameType.Color, FrameType.Depth], every={FrameType.Color: 6})
+
+        Args:
+            frame_types (sequence or None): the :py:class:`.FrameType` values
+                to deliver. If None, frames of all types are delivered.
+            every (dict or None): a mapping from :py:class:`.FrameType` to a
+                positive integer N where only every Nth frame of that type is
+                delivered. Every frame of types which are not present is
+                delivered.
+
+        """
+        if frame_types is None:
+            frame_types = list(FrameType)
+        frame_types = set(FrameType(t) for t in frame_types)
+        every = dict(
+            (FrameType(t), int(n)) for t, n in (every or {}).items())
+        if any(n < 1 for n in every.values()):
+            raise ValueError('Decimation must be a positive integer')
+
+        frame_filter = dict(
+            (t, every.get(t, 1) if t in frame_types else 0) for t in FrameType)
+        for listener in (self.color_frame_listener,
+                         self.ir_and_depth_frame_listener):
+            self._check_frame_filter(listener, frame_filter)
+
+        self._frame_filter = frame_filter
+        for frame_type, n in self._frame_filter.items():
+            self._stats[frame_type]._sequence_step = max(n, 1)
+        self._frame_filter_changed()
+
+    def _frame_filter_changed(self):
+        """Apply the frame filter to the installed listeners, restarting the
+        decimation count."""
+        self._apply_frame_filter(*self._color_frame_listener[::2])
+        self._apply_frame_filter(*self._ir_and_depth_frame_listener[::2])
+
+    def _check_frame_filter(self, listener, frame_filter):
+        """Raise ValueError if *frame_filter* would change the filter of a
+        NativeFrameListener which another device is using."""
+        if not isinstance(listener, NativeFrameListener) or (
+                listener._frame_filter == frame_filter):
+            return
+        device = listener._filter_device()
+        if device is not None and device is not self and listener in (
+                device.color_frame_listener,
+                device.ir_and_depth_frame_listener):
+            raise ValueError(
+                'NativeFrameListener is used by another device with a '
+                'different frame filter')
+
+    def _apply_frame_filter(self, listener, fl):
+        if fl == ffi.NULL:
+            return
+        if isinstance(listener, NativeFrameListener):
+            listener._frame_filter = dict(self._frame_filter)
+            listener._filter_device = weakref.ref(self)
+        for frame_type, n in self._frame_filter.items():
+            lib.freenect2_frame_listener_set_decimation(fl, frame_type.value, n)
+
+    def _listener_for_type(self, frame_type):
+        if frame_type is FrameType.Color:
+            return self.color_frame_listener
+        return self.ir_and_depth_frame_listener
+
     @property
     def color_frame_listener(self):
         """A callable called whenever a new color frame arrives from the
         device. The callable should take two positional arguments, the frame
         type (an instance of :py:class:`.FrameType`) and the frame itself (an
-        instance of :py:class:`.Frame`)."""
+        instance of :py:class:`.Frame`). This may also be a
+        :py:class:`.NativeFrameListener`."""
         return self._color_frame_listener[0]
 
     @color_frame_listener.setter
     def color_frame_listener(self, value):
         if value is None:
-            self._color_frame_listener = (None, None, None)
+            lib.freenect2_device_set_color_frame_listener(
+                self._c_object, ffi.NULL)
+            self._color_frame_listener = (None, None, ffi.NULL)
             return
-        handle, fl = _callable_to_frame_listener(value)
+        self._check_frame_filter(value, self._frame_filter)
+        handle, fl = _to_frame_listener(
+            value, self._stats, self._pool_size)
+        self._apply_frame_filter(value, fl)
         lib.freenect2_device_set_color_frame_listener(self._c_object, fl)
         self._color_frame_listener = value, handle, fl
 
@@ -286,15 +1323,21 @@ class Device(object):
         """A callable called whenever a new IR or depth frame arrives from the
         device. The callable should take two positional arguments, the frame
         type (an instance of :py:class:`.FrameType`) and the frame itself (an
-        instance of :py:class:`.Frame`)."""
+        instance of :py:class:`.Frame`). This may also be a
+        :py:class:`.NativeFrameListener`."""
         return self._ir_and_depth_frame_listener[0]
 
     @ir_and_depth_frame_listener.setter
     def ir_and_depth_frame_listener(self, value):
         if value is None:
-            self._ir_and_depth_frame_listener = (None, None, None)
+            lib.freenect2_device_set_ir_and_depth_frame_listener(
+                self._c_object, ffi.NULL)
+            self._ir_and_depth_frame_listener = (None, None, ffi.NULL)
             return
-        handle, fl = _callable_to_frame_listener(value)
+        self._check_frame_filter(value, self._frame_filter)
+        handle, fl = _to_frame_listener(
+            value, self._stats, self._pool_size)
+        self._apply_frame_filter(value, fl)
         lib.freenect2_device_set_ir_and_depth_frame_listener(self._c_object, fl)
         self._ir_and_depth_frame_listener = value, handle, fl
 
@@ -327,18 +1370,172 @@ class Device(object):
                 yield self.get_next_frame()
         return iterator()
 
+class DeviceGroup(object):
+    """Run several devices concurrently and merge their frames into a single
+    stream.
+
+    Each device delivers frames from its own libfreenect2 threads to a
+    listener which tags them with the device and appends them to a shared
+    queue. Frames are therefore retrieved in the order in which they arrived
+    from all devices.
+
+    .. note::
+
+        Frames are not re-ordered by :py:attr:`.Frame.timestamp`. Each device
+        stamps frames with its own clock and so timestamps from different
+        devices cannot be compared. Arrival order is the closest available
+        approximation to time order across devices.
+
+    .. code::
+
+        from freenect2 import DeviceGroup
+
+        # Open every connected device
+        group = DeviceGroup()
+        with group.running():
+            for device, frame_type, frame in group:
+                # ... process frame ...
+
+    Args:
+        devices (sequence or None): the :py:class:`.Device` instances to run.
+            If None, every device listed by :py:func:`.enumerate_devices` is
+            opened.
+        queue_size (int): the maximum number of frames from all devices
+            waiting for :py:meth:`.get_next_frame`.
+        drop_policy (:py:class:`.DropPolicy`): what to do with a new frame if
+            *queue_size* frames are already waiting. With
+            :py:attr:`.DropPolicy.KeepLatest` at most one frame of each type
+            from each device is queued.
+
+    .. py:attribute:: devices
+
+        (list) The :py:class:`.Device` instances in the group.
+
+    """
+    def __init__(self, devices=None, queue_size=64,
+                 drop_policy=DropPolicy.DropOldest):
+        if devices is None:
+            devices = []
+            try:
+                for serial in enumerate_devices():
+                    devices.append(Device(serial=serial))
+            except Exception:
+                for device in devices:
+                    device.close()
+                raise
+        self.devices = list(devices)
+        self._queue = _DropQueue(queue_size, drop_policy)
+
+    def _listener_for(self, device):
+        put = self._queue.put
+        def listener(frame_type, frame):
+            put((device, frame_type, frame), (device, frame_type))
+        return listener
+
+    def start(self, **kwargs):
+        """Start every device in the group. Keyword arguments are passed to
+        :py:meth:`.Device.start`. If any device fails to start, those already
+        started are stopped."""
+        started = []
+        try:
+            for device in self.devices:
+                device.start(self._listener_for(device), **kwargs)
+                started.append(device)
+        except Exception:
+            for device in started:
+                device.stop()
+            raise
+
+    def stop(self):
+        """Stop every device in the group."""
+        for device in self.devices:
+            device.stop()
+
+    def close(self):
+        """Close every device in the group."""
+        for device in self.devices:
+            device.close()
+
+    @contextmanager
+    def running(self, *args, **kwargs):
+        """A context manager which starts every device in the group and
+        ensures that they are stopped. Any arguments are passed to
+        :py:meth:`.start`."""
+        self.start(*args, **kwargs)
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    def get_next_frame(self, timeout=None):
+        """Get the next frame from any device in the group.
+
+        Args:
+            timeout (number or None): If not-None, a positive number of seconds
+                to wait for a frame before raising a
+                :py:class:`.NoFrameReceivedError` exception.
+
+        Returns:
+            A :py:class:`.Device`, :py:class:`.FrameType`, :py:class:`.Frame`
+            tuple.
+
+        """
+        try:
+            return self._queue.get(True, timeout)
+        except Empty:
+            raise NoFrameReceivedError()
+
+    @property
+    def dropped(self):
+        """A dict mapping :py:class:`.Device`, :py:class:`.FrameType` tuples to
+        the number of frames discarded because the queue was full."""
+        return dict(self._queue.dropped)
+
+    def __iter__(self):
+        def iterator():
+            while True:
+                yield self.get_next_frame()
+        return iterator()
+
 class Frame(object):
     """A single frame received from the device.
 
     These should not be constructed directly since they are usually created by
     the freenect2 library itself. However you may need to construct "blank"
     frames for use with :py:class:`.Registration`. In which case, you should use
-    the :py:meth:`.Frame.create` class method.
+    the :py:meth:`.Frame.create` class method or wrap an existing numpy array
+    with :py:meth:`.Frame.from_array`.
+
+    The frame's attributes are read from libfreenect2 in a single call when the
+    frame is wrapped and are cached thereafter. Setting an attribute updates
+    both the cached value and the underlying libfreenect2 frame.
 
     """
+    __slots__ = (
+        '_c_object', '_width', '_height', '_bytes_per_pixel', '_data_ptr',
+        '_timestamp', '_sequence', '_exposure', '_gain', '_gamma', '_status',
+        '_format', '_owner', '_read_only',
+    )
+
     def __init__(self, frame_ref):
         self._c_object = frame_ref
 
+        info = ffi.new('Freenect2FrameInfo*')
+        lib.freenect2_frame_get_info(frame_ref, info)
+        self._width = info.width
+        self._height = info.height
+        self._bytes_per_pixel = info.bytes_per_pixel
+        self._data_ptr = info.data
+        self._timestamp = info.timestamp
+        self._sequence = info.sequence
+        self._exposure = info.exposure
+        self._gain = info.gain
+        self._gamma = info.gamma
+        self._status = info.status
+        self._format = FrameFormat(info.format)
+        self._owner = None
+        self._read_only = False
+
     @classmethod
     def create(self, width, height, bytes_per_pixel):
         """Create a blank frame with the specified width, height and bytes per
@@ -346,22 +1543,112 @@ class Frame(object):
         attributes are initialised.
 
         """
-        return Frame(lib.freenect2_frame_create(width, height, bytes_per_pixel))
+        return Frame(ffi.gc(
+            lib.freenect2_frame_create(width, height, bytes_per_pixel),
+            lib.freenect2_frame_dispose))
+
+    @classmethod
+    def from_array(cls, array, format=None):
+        """Create a frame which shares memory with a numpy array. No data is
+        copied and the array is kept alive for as long as the frame is.
+
+        Frames may be wrapped around read-only arrays, for example memory
+        mapped recordings. Such frames are read-only: :py:meth:`.to_array`
+        returns a read-only array and passing them as outputs, for example to
+        :py:meth:`.Registration.apply`, raises :py:class:`ValueError`.
+
+        Args:
+            array (array): a C-contiguous array. The first two dimensions are
+                the height and width of the frame. Any further dimension, and
+                the item size, make up the bytes per pixel.
+            format (:py:class:`.FrameFormat` or None): the format of the frame.
+                If None, it is *Float* for 2D float32 arrays, *Gray* for 2D
+                uint8 arrays, *BGRX* for uint8 arrays with 4 channels and
+                *Raw* otherwise.
+
+        .. code::
+
+            depth = Frame.from_array(depth_array)      # 424x512 float32
+            rgb = Frame.from_array(color_array)        # 1080x1920x4 uint8
+            undistorted, registered = registration.apply(rgb, depth)
+
+        """
+        if not isinstance(array, np.ndarray) or not array.flags.c_contiguous:
+            raise ValueError('Expected a C-contiguous numpy array')
+        if array.ndim < 2:
+            raise ValueError('Expected an array with at least two dimensions')
+
+        height, width = array.shape[:2]
+        bytes_per_pixel = array.itemsize * int(np.prod(array.shape[2:]))
+        if format is None:
+            if array.ndim == 2 and array.dtype == np.float32:
+                format = FrameFormat.Float
+            elif array.ndim == 2 and array.dtype == np.uint8:
+                format = FrameFormat.Gray
+            elif array.shape[2:] == (4,) and array.dtype == np.uint8:
+                format = FrameFormat.BGRX
+            else:
+                format = FrameFormat.Raw
+
+        data = ffi.from_buffer(array)
+        frame = Frame(ffi.gc(
+            lib.freenect2_frame_create_with_data(
+                width, height, bytes_per_pixel, data),
+            lib.freenect2_frame_dispose))
+        frame._owner = data
+        frame._read_only = not array.flags.writeable
+        frame.format = format
+        return frame
+
+    def release(self):
+        """Free the frame's memory, or return it to the pool it came from,
+        immediately rather than when the frame is garbage collected. The frame
+        must not be used afterwards and nor may any arrays or images sharing its
+        memory. Methods which need the frame's memory raise
+        :py:class:`ValueError` once it has been released. Calling this more
+        than once has no effect.
+
+        Frames are also context managers which are released on exit:
+
+        .. code::
+
+            with device.get_next_frame()[1] as frame:
+                depth = np.array(frame.to_array())
+
+        """
+        if self._c_object is None:
+            return
+        c_object, self._c_object = self._c_object, None
+        self._data_ptr = None
+        ffi.release(c_object)
+        self._owner = None
+
+    def _check_released(self):
+        if self._c_object is None:
+            raise ValueError('Frame has been released')
+
+    def _check_writeable(self):
+        self._check_released()
+        if self._read_only:
+            raise ValueError('Frame is read-only')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
 
     def to_image(self):
         """Convert the Frame to a PIL :py:class:`Image` instance."""
-        if self.format is FrameFormat.BGRX:
-            return Image.frombuffer(
-                'RGB', (self.width, self.height), self.data, 'raw', 'BGRX')
-        elif self.format is FrameFormat.RGBX:
-            return Image.frombuffer(
-                'RGB', (self.width, self.height), self.data, 'raw', 'RGBX')
-        elif self.format is FrameFormat.Gray:
-            return Image.frombuffer(
-                'L', (self.width, self.height), self.data, 'raw', 'L')
-        elif self.format is FrameFormat.Float:
-            return Image.frombuffer(
-                'F', (self.width, self.height), self.data, 'raw', 'F')
+        format_, size = self._format, (self._width, self._height)
+        if format_ is FrameFormat.BGRX:
+            return Image.frombuffer('RGB', size, self.data, 'raw', 'BGRX')
+        elif format_ is FrameFormat.RGBX:
+            return Image.frombuffer('RGB', size, self.data, 'raw', 'RGBX')
+        elif format_ is FrameFormat.Gray:
+            return Image.frombuffer('L', size, self.data, 'raw', 'L')
+        elif format_ is FrameFormat.Float:
+            return Image.frombuffer('F', size, self.data, 'raw', 'F')
         else:
             raise NotImplementedError()
 
@@ -369,144 +1656,302 @@ class Frame(object):
         """Convert the image to a numpy :py:class:`array` instance.
 
         The memory is not copied so be careful performing any operations which
-        modify the contents of the frame.
+        modify the contents of the frame. The array is read-only if the frame
+        is.
 
         """
-        if self.format is FrameFormat.BGRX or self.format is FrameFormat.RGBX:
-            return np.frombuffer(
+        format_ = self._format
+        if format_ is FrameFormat.BGRX or format_ is FrameFormat.RGBX:
+            array = np.frombuffer(
                 self.data, dtype='uint8').reshape(
-                    (self.height, self.width, 4), order='C')
-        elif self.format is FrameFormat.Gray:
-            return np.frombuffer(
+                    (self._height, self._width, 4), order='C')
+        elif format_ is FrameFormat.Gray:
+            array = np.frombuffer(
                 self.data, dtype='uint8').reshape(
-                    (self.height, self.width), order='C')
-        elif self.format is FrameFormat.Float:
-            return np.frombuffer(
+                    (self._height, self._width), order='C')
+        elif format_ is FrameFormat.Float:
+            array = np.frombuffer(
                 self.data, dtype='float32').reshape(
-                    (self.height, self.width), order='C')
+                    (self._height, self._width), order='C')
         else:
             raise NotImplementedError()
+        if self._read_only:
+            array.flags.writeable = False
+        return array
+
+    def _convert_color(self, convert, channels, out, scale):
+        self._check_released()
+        format_ = self._format
+        if format_ is not FrameFormat.BGRX and format_ is not FrameFormat.RGBX:
+            raise ValueError('Expected a BGRX or RGBX frame')
+        scale = int(scale)
+        if scale < 1:
+            raise ValueError('scale must be a positive integer')
+
+        shape = (self._height // scale, self._width // scale) + channels
+        if out is None:
+            out = np.empty(shape, dtype=np.uint8)
+        elif (out.shape != shape or out.dtype != np.uint8 or
+                not out.flags.c_contiguous or not out.flags.writeable):
+            raise ValueError(
+                'out must be a writeable C-contiguous {} uint8 array'.format(
+                    'x'.join(str(d) for d in shape)))
+
+        convert(
+            self._data_ptr, self._width, self._height,
+            1 if format_ is FrameFormat.RGBX else 0, scale,
+            ffi.from_buffer(out))
+        return out
+
+    def to_rgb(self, out=None, scale=1):
+        """Convert a BGRX or RGBX color frame to a packed RGB numpy array.
+
+        The conversion is performed natively and writes directly into *out*
+        and so, if an output array is re-used, no memory is allocated for each
+        frame.
+
+        Args:
+            out (array or None): if not-None, a writeable C-contiguous uint8
+                array with shape (height // scale, width // scale, 3) to write
+                into.
+            scale (int): if greater than one, each output pixel is the average
+                of a *scale* x *scale* block of input pixels. For example, 2
+                converts a 1920x1080 frame to 960x540.
+
+        Returns:
+            A uint8 array with shape (height // scale, width // scale, 3). If
+            *out* was specified, it is returned.
+
+        """
+        return self._convert_color(lib.freenect2_color_to_rgb, (3,), out, scale)
+
+    def to_gray(self, out=None, scale=1):
+        """Convert a BGRX or RGBX color frame to an 8-bit grayscale numpy
+        array using the ITU-R BT.601 luma weights. Works like
+        :py:meth:`.to_rgb`.
+
+        Args:
+            out (array or None): if not-None, a writeable C-contiguous uint8
+                array with shape (height // scale, width // scale) to write
+                into.
+            scale (int): as for :py:meth:`.to_rgb`.
+
+        Returns:
+            A uint8 array with shape (height // scale, width // scale). If
+            *out* was specified, it is returned.
+
+        """
+        return self._convert_color(lib.freenect2_color_to_gray, (), out, scale)
 
     @property
     def width(self):
         """Length of a line (in pixels)"""
-        return lib.freenect2_frame_get_width(self._c_object)
+        return self._width
 
     @width.setter
     def width(self, value):
+        self._check_released()
         lib.freenect2_frame_set_width(self._c_object, value)
+        self._width = value
 
     @property
     def height(self):
         """Number of lines in the frame"""
-        return lib.freenect2_frame_get_height(self._c_object)
+        return self._height
 
     @height.setter
     def height(self, value):
+        self._check_released()
         lib.freenect2_frame_set_height(self._c_object, value)
+        self._height = value
 
     @property
     def bytes_per_pixel(self):
         """Number of bytes in a pixel. If :py:attr:`.format` is
         :py:attr:`.FrameFormat.Raw`, this is the buffer size."""
-        return lib.freenect2_frame_get_bytes_per_pixel(self._c_object)
+        return self._bytes_per_pixel
 
     @bytes_per_pixel.setter
     def bytes_per_pixel(self, value):
+        self._check_released()
         lib.freenect2_frame_set_bytes_per_pixel(self._c_object, value)
+        self._bytes_per_pixel = value
 
     @property
     def data(self):
         """A buffer object pointing to the raw memory contents of the frame."""
-        data_ptr = lib.freenect2_frame_get_data(self._c_object)
+        self._check_released()
         return ffi.buffer(
-            data_ptr, self.width * self.height * self.bytes_per_pixel)
+            self._data_ptr,
+            self._width * self._height * self._bytes_per_pixel)
 
     @property
     def timestamp(self):
         """Unit: roughly or exactly 0.1 millisecond"""
-        return lib.freenect2_frame_get_timestamp(self._c_object)
+        return self._timestamp
 
     @timestamp.setter
     def timestamp(self, value):
+        self._check_released()
         lib.freenect2_frame_set_timestamp(self._c_object, value)
+        self._timestamp = value
 
     @property
     def sequence(self):
         """Increasing frame sequence number"""
-        return lib.freenect2_frame_get_sequence(self._c_object)
+        return self._sequence
 
     @sequence.setter
     def sequence(self, value):
+        self._check_released()
         lib.freenect2_frame_set_sequence(self._c_object, value)
+        self._sequence = value
 
     @property
     def exposure(self):
         """From 0.5 (very bright) to ~60.0 (fully covered)"""
-        return lib.freenect2_frame_get_exposure(self._c_object)
+        return self._exposure
 
     @exposure.setter
     def exposure(self, value):
+        self._check_released()
         lib.freenect2_frame_set_exposure(self._c_object, value)
+        self._exposure = lib.freenect2_frame_get_exposure(self._c_object)
 
     @property
     def gain(self):
         """From 1.0 (bright) to 1.5 (covered)"""
-        return lib.freenect2_frame_get_gain(self._c_object)
+        return self._gain
 
     @gain.setter
     def gain(self, value):
+        self._check_released()
         lib.freenect2_frame_set_gain(self._c_object, value)
+        self._gain = lib.freenect2_frame_get_gain(self._c_object)
 
     @property
     def gamma(self):
         """From 1.0 (bright) to 6.4 (covered)"""
-        return lib.freenect2_frame_get_gamma(self._c_object)
+        return self._gamma
 
     @gamma.setter
     def gamma(self, value):
+        self._check_released()
         lib.freenect2_frame_set_gamma(self._c_object, value)
+        self._gamma = lib.freenect2_frame_get_gamma(self._c_object)
 
     @property
     def status(self):
         """zero if ok; non-zero for errors"""
-        return lib.freenect2_frame_get_status(self._c_object)
+        return self._status
 
     @status.setter
     def status(self, value):
+        self._check_released()
         lib.freenect2_frame_set_status(self._c_object, value)
+        self._status = value
 
     @property
     def format(self):
         """Byte format. Informative only, doesn't indicate errors. An instance
         of :py:class:`.FrameFormat`."""
-        return FrameFormat(lib.freenect2_frame_get_format(self._c_object))
+        return self._format
 
     @format.setter
     def format(self, value):
+        self._check_released()
         lib.freenect2_frame_set_format(self._c_object, value.value)
+        self._format = value
 
     def __repr__(self):
         return (
             'Frame(width={0.width}, height={0.height}, sequence={0.sequence}, '
             'timestamp={0.timestamp}, format={0.format})').format(self)
 
+def _check_frame_shape(frame, width, height, bytes_per_pixel,
+                       writeable=False):
+    """Raise ValueError if *frame* does not have the specified geometry or
+    has been released or, if *writeable* is true, is read-only."""
+    if frame is not None:
+        frame._check_released()
+    if frame is None or (frame.width, frame.height, frame.bytes_per_pixel) != (
+            width, height, bytes_per_pixel):
+        raise ValueError(
+            'Expected a {}x{} frame with {} bytes per pixel, got {!r}'.format(
+                width, height, bytes_per_pixel, frame))
+    if writeable:
+        frame._check_writeable()
+
 class Registration(object):
     """Information required to undistort raw depth frames and register RGB
     frames onto depth.
 
-    Do not construct this directly. Instead use the
-    :py:attr:`.Device.registration` attribute.
+    Usually this is not constructed directly. Instead use the
+    :py:attr:`.Device.registration` attribute or, if the calibration is
+    known, :py:meth:`.from_params`.
+
+    Args:
+        depth_p (:py:class:`.IrCameraParams`): IR camera calibration.
+        rgb_p (:py:class:`.ColorCameraParams`): color camera calibration.
+
+    .. py:attribute:: depth_p
+
+        (:py:class:`.IrCameraParams`) The IR camera calibration.
+
+    .. py:attribute:: rgb_p
+
+        (:py:class:`.ColorCameraParams`) The color camera calibration.
 
     """
+    # The most recently used instances created by from_params keyed by a
+    # snapshot of the calibration values.
+    _cache = OrderedDict()
+    _cache_size = 8
+    _cache_lock = threading.Lock()
+
     def __init__(self, depth_p, rgb_p):
-        self.depth_p = depth_p
-        self.rgb_p = rgb_p
+        self.depth_p = IrCameraParams._coerce(depth_p)
+        self.rgb_p = ColorCameraParams._coerce(rgb_p)
         self._c_object = ffi.gc(
-            lib.freenect2_registration_create(depth_p, rgb_p),
+            lib.freenect2_registration_create(
+                self.depth_p._to_c(), self.rgb_p._to_c()),
             lib.freenect2_registration_dispose)
+        self._depth_rays = None
+        self._big_depth_rays = None
+        self._lookup_tables = None
+
+    @classmethod
+    def from_params(cls, depth_p, rgb_p):
+        """Return a :py:class:`.Registration` for the given calibration.
 
-    def apply(self, rgb, depth, enable_filter=True, with_big_depth=False):
+        The most recently used instances are cached by calibration and so
+        calling this repeatedly with equal calibration, for example once per
+        task in a worker process, returns the same instance without
+        re-creating the libfreenect2 object or its lookup tables. The
+        calibration is copied and so modifying *depth_p* or *rgb_p* afterwards
+        has no effect on the returned instance.
+
+        Args:
+            depth_p (:py:class:`.IrCameraParams`): IR camera calibration.
+            rgb_p (:py:class:`.ColorCameraParams`): color camera calibration.
+
+        """
+        depth_p = IrCameraParams._coerce(depth_p)
+        rgb_p = ColorCameraParams._coerce(rgb_p)
+        key = depth_p._values(), rgb_p._values()
+        with cls._cache_lock:
+            registration = cls._cache.pop(key, None)
+            if registration is None:
+                registration = cls(
+                    IrCameraParams.from_dict(depth_p.to_dict()),
+                    ColorCameraParams.from_dict(rgb_p.to_dict()))
+            cls._cache[key] = registration
+            while len(cls._cache) > cls._cache_size:
+                cls._cache.popitem(last=False)
+        return registration
+
+    def apply(self, rgb, depth, enable_filter=True, with_big_depth=False,
+              out=None):
         """Take an RGB and Depth image and return tuple with the undistorted
         depth image and color image rectified onto depth.
 
@@ -517,20 +1962,48 @@ class Registration(object):
                 both cameras.
             with_big_depth (bool): If true, also return a 1920x1082 mapping of
                 depth onto the color map. The top and bottom rows are blank.
+                libfreenect2 only computes this map if *enable_filter* is true.
+            out (tuple or None): If not-None, a tuple of frames to write the
+                result into instead of allocating new ones. Usually this is the
+                tuple returned by a previous call to :py:meth:`.apply`. It
+                must contain a big depth frame if *with_big_depth* is true.
 
         Returns:
             A :py:class:`Frame` pair representing the undistorted depth and
-            registered RGB frames.
+            registered RGB frames. If *out* was specified, the frames are those
+            passed in *out*.
+
+        .. code::
+
+            # Allocate output frames once and re-use them for each frame pair
+            out = registration.apply(rgb, depth)
+            while True:
+                # ... receive new rgb and depth frames ...
+                undistorted, registered = registration.apply(
+                    rgb, depth, out=out)
 
         """
-        undistorted = Frame.create(512, 424, 4)
+        if out is None:
+            out = (
+                Frame.create(512, 424, 4), Frame.create(512, 424, 4),
+                Frame.create(1920, 1082, 4) if with_big_depth else None
+            )
+        elif with_big_depth and (len(out) < 3 or out[2] is None):
+            raise ValueError('out must contain a big depth frame')
+        else:
+            out = tuple(out) + (None,) * (3 - len(out))
+
+        undistorted, registered, big_depth = out
+        rgb._check_released()
+        depth._check_released()
+        _check_frame_shape(undistorted, 512, 424, 4, writeable=True)
+        _check_frame_shape(registered, 512, 424, 4, writeable=True)
         undistorted.format = depth.format
-        registered = Frame.create(512, 424, 4)
         registered.format = rgb.format
 
-        big_depth, big_depth_ref = None, ffi.NULL
+        big_depth_ref = ffi.NULL
         if with_big_depth:
-            big_depth = Frame.create(1920, 1082, 4)
+            _check_frame_shape(big_depth, 1920, 1082, 4, writeable=True)
             big_depth.format = depth.format
             big_depth_ref = big_depth._c_object
 
@@ -547,6 +2020,40 @@ class Registration(object):
 
         return tuple(rvs)
 
+    def undistort_depth(self, depth, out=None):
+        """Undistort a depth frame without registering a color frame onto it.
+        The result is the same as the undistorted depth returned by
+        :py:meth:`.apply` but no color frame is required and none of the color
+        mapping is performed.
+
+        Args:
+            depth (:py:class:`.Frame`): Depth frame received from device
+            out (:py:class:`.Frame` or None): If not-None, a 512x424 frame with
+                4 bytes per pixel to write the result into instead of
+                allocating a new one.
+
+        Returns:
+            A :py:class:`.Frame` with the undistorted depth. Pixels with no
+            corresponding depth are zero. If *out* was specified, it is
+            returned.
+
+        .. code::
+
+            undistorted = registration.undistort_depth(depth)
+            points = registration.get_points_xyz_array(undistorted)
+
+        """
+        _check_frame_shape(depth, 512, 424, 4)
+        depth._check_released()
+        if out is None:
+            out = Frame.create(512, 424, 4)
+        _check_frame_shape(out, 512, 424, 4, writeable=True)
+        out.format = depth.format
+
+        lib.freenect2_registration_undistort_depth(
+            self._c_object, depth._c_object, out._c_object)
+        return out
+
     def get_points_xyz(self, undistorted, rows, cols):
         """Retrieve real-world co-ordinates corresponding to points in the
         undistorted depth image. Units are millimetres.
@@ -562,6 +2069,7 @@ class Registration(object):
             z-co-ordinates of the points. Each array has the same shape as
             *rows*.
         """
+        undistorted._check_released()
         rows = np.atleast_1d(rows).astype(np.int32)
         cols = np.atleast_1d(cols).astype(np.int32)
         assert rows.shape == cols.shape
@@ -579,46 +2087,363 @@ class Registration(object):
         )
         return xs, ys, -zs
 
-    def get_points_xyz_array(self, undistorted):
+    def _get_lookup_tables(self):
+        """Return the cached distortion map, depth to color map and the rounded
+        color rows of the depth to color map. These are computed exactly as
+        libfreenect2 computes its internal tables, in single precision."""
+        if self._lookup_tables is None:
+            f32 = np.float32
+            depth_p, rgb_p = self.depth_p, self.rgb_p
+            fx, fy = f32(depth_p.fx), f32(depth_p.fy)
+            cx, cy = f32(depth_p.cx), f32(depth_p.cy)
+            k1, k2, k3 = f32(depth_p.k1), f32(depth_p.k2), f32(depth_p.k3)
+            p1, p2 = f32(depth_p.p1), f32(depth_p.p2)
+            ys, xs = np.mgrid[:424, :512].astype(f32)
+
+            # Position of each undistorted pixel in the raw depth image
+            dx, dy = (xs - cx) / fx, (ys - cy) / fy
+            dx2, dy2 = dx * dx, dy * dy
+            r2 = dx2 + dy2
+            dxdy2 = 2 * dx * dy
+            kr = 1 + ((k3 * r2 + k2) * r2 + k1) * r2
+            mx = fx * (dx * kr + p2 * (r2 + 2 * dx2) + p1 * dxdy2) + cx
+            my = fy * (dy * kr + p1 * (r2 + 2 * dy2) + p2 * dxdy2) + cy
+            ix = (mx + f32(0.5)).astype(np.int32)
+            iy = (my + f32(0.5)).astype(np.int32)
+            distort_map = np.where(
+                (ix >= 0) & (ix < 512) & (iy >= 0) & (iy < 424),
+                iy * 512 + ix, -1).astype(np.int32)
+
+            # Position of each undistorted pixel in the color image excluding
+            # the depth-dependent shift
+            mx = (xs - cx) * f32(0.01)
+            my = (ys - cy) * f32(0.01)
+            def polynomial(prefix):
+                def coeff(name):
+                    return f32(getattr(rgb_p, prefix + name))
+                return (
+                    (mx * mx * mx * coeff('x3y0')) +
+                    (my * my * my * coeff('x0y3')) +
+                    (mx * mx * my * coeff('x2y1')) +
+                    (my * my * mx * coeff('x1y2')) +
+                    (mx * mx * coeff('x2y0')) + (my * my * coeff('x0y2')) +
+                    (mx * my * coeff('x1y1')) + (mx * coeff('x1y0')) +
+                    (my * coeff('x0y1')) + coeff('x0y0'))
+            color_q = f32(0.002199)
+            color_map = np.empty((424, 512, 2), dtype=f32)
+            color_map[..., 0] = polynomial('mx_') / (f32(rgb_p.fx) * color_q) - (
+                f32(rgb_p.shift_m) / f32(rgb_p.shift_d))
+            color_map[..., 1] = polynomial('my_') / color_q + f32(rgb_p.cy)
+            color_rows = (color_map[..., 1] + f32(0.5)).astype(np.int32)
+
+            self._lookup_tables = distort_map, color_map, color_rows
+        return self._lookup_tables
+
+    @property
+    def distort_map(self):
+        """A 424x512 int32 array giving, for each pixel in the undistorted
+        depth image, the index of the pixel in the flattened raw depth image
+        which it is taken from or -1 if it lies outside the raw image. This is
+        the table libfreenect2 uses to undistort depth. It is computed from
+        :py:attr:`.depth_p` on first access and cached thereafter.
+
+        .. code::
+
+            undistorted = np.where(
+                distort_map >= 0, depth.ravel()[distort_map], 0)
+
+        """
+        return self._get_lookup_tables()[0]
+
+    @property
+    def depth_to_color_map(self):
+        """A 424x512x2 float32 array mapping each pixel in the undistorted
+        depth image to the color image. This is the table libfreenect2 uses to
+        register color onto depth. The last dimension is *x*, *y*. A pixel with
+        depth *z* millimetres is registered to the color pixel in column
+        ``int((x + shift_m / z) * fx + cx + 0.5)`` and row ``int(y + 0.5)``
+        where *shift_m*, *fx* and *cx* are from :py:attr:`.rgb_p`. The table
+        is computed on first access and cached thereafter.
+
+        """
+        return self._get_lookup_tables()[1]
+
+    def apply_batch(self, rgbs, depths, enable_filter=True,
+                    with_big_depth=False):
+        """Like :py:meth:`.apply` but registers a whole stack of frames at
+        once with vectorised numpy operations on the tables in
+        :py:attr:`.distort_map` and :py:attr:`.depth_to_color_map`. The results
+        are the same as those of :py:meth:`.apply` with one exception:
+        libfreenect2 only computes the big depth map while filtering and so
+        :py:meth:`.apply` leaves it untouched if *enable_filter* is false.
+        This method always computes it.
+
+        Args:
+            rgbs (array): an Nx1080x1920x4 uint8 array of BGRX color frames.
+            depths (array): an Nx424x512 float32 array of depth frames.
+            enable_filter (bool): If true, filter out pixels not visible in
+                both cameras.
+            with_big_depth (bool): If true, also return an Nx1082x1920 array
+                mapping depth onto the color images. The top and bottom rows
+                are blank. It is computed even if *enable_filter* is false.
+
+        Returns:
+            A tuple of an Nx424x512 float32 array of undistorted depth and an
+            Nx424x512x4 uint8 array of registered color with, if
+            *with_big_depth* is true, the big depth array.
+
+        .. code::
+
+            depths = np.stack([d.to_array() for d in depth_frames])
+            rgbs = np.stack([c.to_array() for c in rgb_frames])
+            undistorted, registered = registration.apply_batch(rgbs, depths)
+
+        """
+        depths = np.asarray(depths, dtype=np.float32)
+        rgbs = np.ascontiguousarray(rgbs, dtype=np.uint8)
+        n_frames = depths.shape[0]
+        if depths.shape[1:] != (424, 512):
+            raise ValueError('depths must be an Nx424x512 array')
+        if rgbs.shape != (n_frames, 1080, 1920, 4):
+            raise ValueError('rgbs must be an Nx1080x1920x4 array')
+
+        distort_map, color_map, color_rows = self._get_lookup_tables()
+        distort_map, color_rows = distort_map.ravel(), color_rows.ravel()
+        map_x = color_map[..., 0].ravel()
+        inside = distort_map >= 0
+        size_color = 1920 * 1080
+
+        undistorted = np.zeros((n_frames, 424 * 512), dtype=np.float32)
+        undistorted[:, inside] = depths.reshape((n_frames, -1))[
+            :, distort_map[inside]]
+
+        # Color pixel offsets of valid depth pixels
+        valid = undistorted > 0
+        frame_idxs, pixel_idxs = np.nonzero(valid)
+        zs = undistorted[frame_idxs, pixel_idxs]
+        f32 = np.float32
+        rx = (map_x[pixel_idxs] + f32(self.rgb_p.shift_m) / zs) * f32(
+            self.rgb_p.fx) + (f32(self.rgb_p.cx) + f32(0.5))
+        c_offs = rx.astype(np.int32) + color_rows[pixel_idxs] * 1920
+        in_color = (c_offs >= 0) & (c_offs < size_color)
+        frame_idxs, pixel_idxs = frame_idxs[in_color], pixel_idxs[in_color]
+        zs, c_offs = zs[in_color], c_offs[in_color]
+
+        colors = rgbs.view(np.uint32).reshape((n_frames, -1))[frame_idxs, c_offs]
+
+        big_depth = None
+        if enable_filter or with_big_depth:
+            big_depth = self._filter_map(n_frames, frame_idxs, c_offs, zs)
+        if enable_filter:
+            min_zs = big_depth[frame_idxs, 1920 + c_offs]
+            colors[(zs - min_zs) / zs > f32(0.01)] = 0
+
+        registered = np.zeros((n_frames, 424 * 512), dtype=np.uint32)
+        registered[frame_idxs, pixel_idxs] = colors
+
+        result = (
+            undistorted.reshape((n_frames, 424, 512)),
+            registered.view(np.uint8).reshape((n_frames, 424, 512, 4)))
+        if with_big_depth:
+            result += (big_depth.reshape((n_frames, 1082, 1920)),)
+        return result
+
+    @staticmethod
+    def _filter_map(n_frames, frame_idxs, c_offs, zs):
+        """Return the flattened Nx1082x1920 map holding, for each color pixel,
+        the minimum depth of the depth pixels registered within 2 columns and 1
+        row of it. Like libfreenect2, windows are applied to the flattened
+        image and so wrap between rows."""
+        size = 1920 * 1082
+
+        # Minimum depth registered to each pixel, with two extra pixels at each
+        # end for the horizontal window
+        nearest = np.full((n_frames, size + 4), np.inf, dtype=np.float32)
+        np.minimum.at(
+            nearest.reshape(-1), frame_idxs * (size + 4) + 2 + 1920 + c_offs,
+            zs)
+
+        filtered = nearest[:, 2:-2].copy()
+        for shift in (0, 1, 3, 4):
+            np.minimum(filtered, nearest[:, shift:shift + size], out=filtered)
+        rows = filtered.copy()
+        np.minimum(filtered[:, 1920:], rows[:, :-1920], out=filtered[:, 1920:])
+        np.minimum(filtered[:, :-1920], rows[:, 1920:], out=filtered[:, :-1920])
+
+        return filtered
+
+    @property
+    def depth_rays(self):
+        """A 424x512x2 float32 array giving, for each pixel in the undistorted
+        depth image, the x/z and y/z ratios of the ray through that pixel. The
+        table is computed from :py:attr:`.depth_p` on first access and cached
+        thereafter. Multiplying it by the depth in metres gives the x and y
+        co-ordinates of each point.
+
+        """
+        if self._depth_rays is None:
+            rays = np.empty((424, 512, 2), dtype=np.float32)
+            rays[..., 0] = (
+                (np.arange(512) + 0.5 - self.depth_p.cx) / self.depth_p.fx
+            )[np.newaxis, :]
+            rays[..., 1] = (
+                (np.arange(424) + 0.5 - self.depth_p.cy) / self.depth_p.fy
+            )[:, np.newaxis]
+            self._depth_rays = rays
+        return self._depth_rays
+
+    def get_points_xyz_array(self, undistorted, out=None):
         """Return a 3D array of x, y, z points for each point in an undistorted
         frame. Invalid points are Nan-ed.
 
+        The points are computed with the cached :py:attr:`.depth_rays` table
+        and so this is considerably faster than calling
+        :py:meth:`.get_points_xyz` with every pixel in the frame.
+
         Args:
             undistorted (:py:class:`.Frame`): the undistorted depth frame
+            out (array or None): if not-None, a 424x512x3 float32 array which
+                the result is written into.
 
         Returns:
             A 424x512x3 array of 3D points. The last dimension corresponding to
-            x, y and z.
+            x, y and z. If *out* was specified, it is returned.
 
         """
-        cols, rows = np.meshgrid(
-            np.arange(undistorted.width), np.arange(undistorted.height))
-        return np.dstack(self.get_points_xyz(undistorted, rows, cols))
+        depth = undistorted.to_array()
+        if depth.shape != (424, 512):
+            raise ValueError('Expected a 512x424 undistorted depth frame')
+
+        if out is None:
+            out = np.empty((424, 512, 3), dtype=np.float32)
+        elif out.shape != (424, 512, 3) or out.dtype != np.float32:
+            raise ValueError('out must be a 424x512x3 float32 array')
+
+        rays = self.depth_rays
+        zs = out[..., 2]
+        np.divide(depth, 1000, out=zs)
+        invalid = ~(zs > 0.001)
+        np.multiply(rays[..., 0], zs, out=out[..., 0])
+        np.multiply(rays[..., 1], zs, out=out[..., 1])
+        np.negative(zs, out=zs)
+        out[invalid] = np.nan
+
+        return out
+
+    def get_valid_points_xyz(self, undistorted, registered=None):
+        """Return only the valid points in an undistorted frame along with the
+        pixel each came from. Typical scenes have many invalid pixels and so
+        this is much smaller than the array returned by
+        :py:meth:`.get_points_xyz_array`.
 
-    def get_big_points_xyz_array(self, big_depth):
+        Args:
+            undistorted (:py:class:`.Frame`): the undistorted depth frame
+            registered (:py:class:`.Frame` or None): if not-None, the
+                registered BGRX or RGBX frame returned along with
+                *undistorted* by :py:meth:`.apply`.
+
+        Returns:
+            A tuple containing an Nx3 float32 array of points and two N element
+            int32 arrays giving the row and column of each point in the
+            undistorted frame. Points are as for
+            :py:meth:`.get_points_xyz_array` and are in row-major pixel order.
+            If *registered* is not-None, an Nx3 uint8 array of the red, green
+            and blue values of each point is appended.
+
+        .. code::
+
+            points, rows, cols, colors = registration.get_valid_points_xyz(
+                undistorted, registered)
+
+        """
+        depth = undistorted.to_array()
+        if depth.shape != (424, 512):
+            raise ValueError('Expected a 512x424 undistorted depth frame')
+
+        zs = np.divide(depth.ravel(), 1000)
+        idxs = np.flatnonzero(zs > 0.001)
+        zs = zs[idxs]
+        rays = self.depth_rays.reshape((-1, 2))[idxs]
+
+        points = np.empty((len(idxs), 3), dtype=np.float32)
+        np.multiply(rays[:, 0], zs, out=points[:, 0])
+        np.multiply(rays[:, 1], zs, out=points[:, 1])
+        np.negative(zs, out=points[:, 2])
+        rows, cols = np.divmod(idxs.astype(np.int32), 512)
+
+        if registered is None:
+            return points, rows, cols
+
+        if registered.format is FrameFormat.BGRX:
+            channels = [2, 1, 0]
+        elif registered.format is FrameFormat.RGBX:
+            channels = [0, 1, 2]
+        else:
+            raise ValueError('Expected a BGRX or RGBX registered frame')
+        _check_frame_shape(registered, 512, 424, 4)
+        colors = registered.to_array().reshape((-1, 4))[idxs][:, channels]
+        return points, rows, cols, colors
+
+    def _get_big_depth_rays(self):
+        """Return the cached x/z and y/z ratios of the rays through the columns
+        and rows of the "big" depth map. The first is a 1x1920 array and the
+        second is a 1082x1 array so that they broadcast against the map.
+
+        """
+        if self._big_depth_rays is None:
+            self._big_depth_rays = (
+                ((np.arange(1920) - self.rgb_p.cx) / self.rgb_p.fx).astype(
+                    np.float32)[np.newaxis, :],
+                ((1080 - np.arange(-1, 1081) - self.rgb_p.cy) / self.rgb_p.fy
+                ).astype(np.float32)[:, np.newaxis],
+            )
+        return self._big_depth_rays
+
+    def get_big_points_xyz_array(self, big_depth, out=None,
+                                 valid_rows_only=False):
         """Like :py:meth:`.get_points_xyz_array` but operates on the "big" depth
         map which can be returned from :py:meth:`.apply`.
 
         Args:
             big_depth (:py:class:`.Frame`): big 1920x1082 frame returned from
                 :py:meth:`.apply`.
+            out (array or None): if not-None, a float32 array which the result
+                is written into. It must be 1082x1920x3 or, if
+                *valid_rows_only* is true, 1080x1920x3.
+            valid_rows_only (bool): if true, omit the blank first and last rows
+                of the big depth map and return only the 1080 rows which
+                correspond to the color image.
 
         Returns:
-            A 1082x1920x3 array of 3D points. The last dimension corresponding
-            to x, y and z.
+            A 1082x1920x3 (or 1080x1920x3 if *valid_rows_only* is true) array
+            of 3D points. The last dimension corresponding to x, y and z. If
+            *out* was specified, it is returned.
 
         """
-        points = np.ones((big_depth.height, big_depth.width, 3), dtype=np.float32)
-        points[..., 2] = 1e-3 * big_depth.to_array()
-        points[..., 0], points[..., 1] = np.meshgrid(
-            (np.arange(1920) - self.rgb_p.cx) / self.rgb_p.fx,
-            (1080-np.arange(-1, 1081) - self.rgb_p.cy) / self.rgb_p.fy)
-        points[..., 0] *= points[..., 2]
-        points[..., 1] *= points[..., 2]
-
-        return points
-
-    def write_pcd(self, file_object, undistorted, registered=None):
+        depth = big_depth.to_array()
+        if depth.shape != (1082, 1920):
+            raise ValueError('Expected a 1920x1082 big depth frame')
+
+        x_rays, y_rays = self._get_big_depth_rays()
+        if valid_rows_only:
+            depth, y_rays = depth[1:-1, ...], y_rays[1:-1, ...]
+
+        shape = depth.shape + (3,)
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        elif out.shape != shape or out.dtype != np.float32:
+            raise ValueError('out must be a {}x{}x3 float32 array'.format(
+                *depth.shape))
+
+        zs = out[..., 2]
+        np.multiply(depth, np.float32(1e-3), out=zs)
+        np.multiply(x_rays, zs, out=out[..., 0])
+        np.multiply(y_rays, zs, out=out[..., 1])
+
+        return out
+
+    def write_pcd(self, file_object, undistorted, registered=None,
+                  skip_invalid=False, compressed=False):
         """Write depth map and (optionally) RGB data to libpcl-compatible PCD
         format file. If the registered RGB frame is present, each point is
         coloured according to the image otherwise the points are left
@@ -633,11 +2458,15 @@ class Registration(object):
             undistorted (:py:class:`Frame`): the undistorted depth frame
             registered (:py:class:`Frame`): if not-None, the RGB data corresponding to
                 the depth frame.
+            skip_invalid (bool): as for :py:func:`write_pcd`.
+            compressed (bool): as for :py:func:`write_pcd`.
         """
         write_pcd(
-            file_object, self.get_points_xyz_array(undistorted), registered)
+            file_object, self.get_points_xyz_array(undistorted), registered,
+            skip_invalid=skip_invalid, compressed=compressed)
 
-    def write_big_pcd(self, file_object, big_depth, rgb=None):
+    def write_big_pcd(self, file_object, big_depth, rgb=None,
+                      skip_invalid=False, compressed=False):
         """Write depth map and (optionally) RGB data to libpcl-compatible PCD
         format file. Works like :py:meth:`.write_pcd` except that it works on
         the "big" depth map which can be returned from :py:meth:`apply`. If the
@@ -650,20 +2479,40 @@ class Registration(object):
 
         Args:
             file_object (file): A file object to write PCD data to
-            big_depth (:py:class:`Frame`): the 1920x1082 de[th frame
-            registered (:py:class:`Frame`): if not-None, the RGB data from the
+            big_depth (:py:class:`Frame`): the 1920x1082 depth frame
+            rgb (:py:class:`Frame`): if not-None, the RGB data from the
                 color camera
+            skip_invalid (bool): as for :py:func:`write_pcd`.
+            compressed (bool): as for :py:func:`write_pcd`.
         """
         write_pcd(
             file_object,
-            self.get_big_points_xyz_array(big_depth)[1:-1, ...], rgb)
-
-def write_pcd(file_object, points, rgb=None):
+            self.get_big_points_xyz_array(big_depth, valid_rows_only=True),
+            rgb, skip_invalid=skip_invalid, compressed=compressed)
+
+def _lzf_compress(data):
+    """Compress a contiguous array with LZF and return a memoryview of the
+    compressed bytes."""
+    in_len = data.nbytes
+    out = bytearray(in_len + in_len // 32 + 16)
+    out_len = lib.freenect2_lzf_compress(
+        ffi.from_buffer(data), in_len, ffi.from_buffer(out), len(out))
+    if out_len == 0:
+        raise RuntimeError('LZF compression failed')
+    return memoryview(out)[:out_len]
+
+def write_pcd(file_object, points, rgb=None, skip_invalid=False,
+              compressed=False):
     """Write 3d points and (optionally) RGB data to libpcl-compatible PCD
     format file. If the registered RGB frame is present, each point is
     coloured according to the image otherwise the points are left
     uncoloured.
 
+    Records are assembled in a single structured array with one field per PCD
+    field and written directly from that buffer. If there is no RGB data and
+    no points are skipped, the points array itself is written without any
+    copy.
+
     .. note::
 
         Under Python 3 the file object *must* be opened in binary mode.
@@ -673,36 +2522,73 @@ def write_pcd(file_object, points, rgb=None):
         points (array): A NxMx3 array of 3d points.
         rgb (:py:class:`Frame`): if not-None, the RGB frame corresponding to
             the points array. Assumed to be NxM.
+        skip_invalid (bool): if true, points whose z co-ordinate is NaN or
+            zero are omitted and an unorganised point cloud with a height of
+            1 is written.
+        compressed (bool): if true, write the data in PCD's LZF-compressed
+            ``binary_compressed`` format rather than ``binary``.
     """
-    assert len(points.shape) == 3
-    xs, ys, zs = points[..., 0], points[..., 1], points[..., 2]
-    n_points = int(np.product(points.shape[:-1]))
+    if len(points.shape) != 3 or points.shape[2] != 3:
+        raise ValueError('Expected an NxMx3 array of points')
+    points = np.ascontiguousarray(points, dtype=np.float32)
+    height, width = points.shape[:2]
+
+    # Each column is viewed as uint32 so that point and colour fields can
+    # share a record layout.
+    names = ['x', 'y', 'z']
+    columns = [points[..., idx].view(np.uint32) for idx in range(3)]
+    if rgb is not None:
+        bgrx = rgb.to_array()
+        if bgrx.shape != (height, width, 4) or bgrx.dtype != np.uint8:
+            raise ValueError('Expected a {}x{} BGRX frame'.format(
+                width, height))
+        names.append('rgb')
+        columns.append(np.ascontiguousarray(bgrx).view(np.uint32)[..., 0])
+
+    mask = None
+    if skip_invalid:
+        zs = points[..., 2]
+        mask = np.isfinite(zs) & (zs != 0)
+        width, height = int(np.count_nonzero(mask)), 1
+    n_points = width * height
+
+    def column_values(idx):
+        column = columns[idx]
+        return column.reshape(-1) if mask is None else column[mask]
+
+    if compressed:
+        # binary_compressed data is stored one field after another rather
+        # than one point after another.
+        data = np.empty((len(names), n_points), dtype=np.uint32)
+        for idx in range(len(names)):
+            data[idx] = column_values(idx)
+    elif rgb is None and mask is None:
+        data = points
+    else:
+        data = np.empty(n_points, dtype=np.dtype(
+            [(name, '<u4') for name in names]))
+        for idx, name in enumerate(names):
+            data[name] = column_values(idx)
+    if rgb is not None:
+        # Clear the unused X byte of BGRX pixels
+        rgb_values = data[3] if compressed else data['rgb']
+        np.bitwise_and(rgb_values, 0xffffff, out=rgb_values)
 
     file_object.write(b'VERSION .7\n')
-
-    if rgb is None:
-        file_object.write(
-            b'FIELDS x y z\nSIZE 4 4 4\nTYPE F F F\nCOUNT 1 1 1\n')
-        data = np.zeros((n_points, 3), order='C', dtype=np.float32)
-        data[:, 0] = xs.flatten()
-        data[:, 1] = ys.flatten()
-        data[:, 2] = zs.flatten()
-    else:
-        file_object.write(
-            b'FIELDS x y z rgb\nSIZE 4 4 4 4\nTYPE F F F F\nCOUNT 1 1 1 1\n')
-        bgrx = rgb.to_array().astype(np.uint32)
-        rgbs = (
-            bgrx[..., 0] + (bgrx[..., 1] << 8) + (bgrx[..., 2] << 16)
-        ).view(np.float32)
-        data = np.zeros((n_points, 4), order='C', dtype=np.float32)
-        data[:, 0] = xs.flatten()
-        data[:, 1] = ys.flatten()
-        data[:, 2] = zs.flatten()
-        data[:, 3] = rgbs.flatten()
-
-    file_object.write('WIDTH {}\n'.format(points.shape[1]).encode())
-    file_object.write('HEIGHT {}\n'.format(points.shape[0]).encode())
+    file_object.write('FIELDS {}\n'.format(' '.join(names)).encode())
+    file_object.write('SIZE {}\n'.format(' '.join(['4'] * len(names))).encode())
+    file_object.write('TYPE {}\n'.format(' '.join(['F'] * len(names))).encode())
+    file_object.write('COUNT {}\n'.format(' '.join(['1'] * len(names))).encode())
+    file_object.write('WIDTH {}\n'.format(width).encode())
+    file_object.write('HEIGHT {}\n'.format(height).encode())
     file_object.write(b'VIEWPOINT 0 0 0 1 0 0 0\n')
     file_object.write('POINTS {}\n'.format(n_points).encode())
-    file_object.write(b'DATA binary\n')
-    file_object.write(data.tobytes())
+
+    if compressed:
+        file_object.write(b'DATA binary_compressed\n')
+        payload = _lzf_compress(data) if data.nbytes > 0 else b''
+        file_object.write(struct.pack('<II', len(payload), data.nbytes))
+        file_object.write(payload)
+    else:
+        file_object.write(b'DATA binary\n')
+        file_object.write(np.ascontiguousarray(data).view(np.uint8))
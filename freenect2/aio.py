@@ -0,0 +1,137 @@
+"""
+Support for receiving frames in an :py:mod:`asyncio` event loop. Requires
+Python 3.5 or later.
+
+Frames are handed from libfreenect2's threads to the event loop without any
+thread blocking on a queue and so a single event loop may serve many devices.
+Usually this module is used via :py:meth:`freenect2.Device.aiter` and
+:py:meth:`freenect2.Device.next_frame`:
+
+.. code::
+
+    import asyncio
+    from freenect2 import Device
+    from freenect2.aio import AsyncFrameListener
+
+    async def capture(device):
+        async for frame_type, frame in device.aiter():
+            # ... process frame ...
+
+    device = Device()
+    device.start(AsyncFrameListener())
+    asyncio.get_event_loop().run_until_complete(capture(device))
+
+"""
+import asyncio
+from queue import Empty
+
+from . import DropPolicy, FrameType, NoFrameReceivedError, _DropQueue
+
+__all__ = (
+    'AsyncFrameListener',
+)
+
+class AsyncFrameListener(object):
+    """A frame listener which queues frames for an :py:mod:`asyncio` event
+    loop.
+
+    Frames are queued on the thread which delivers them, exactly as for
+    :py:class:`freenect2.QueueFrameListener`, and so the queue is bounded even
+    if the event loop stalls. The event loop is woken with
+    :py:meth:`asyncio.AbstractEventLoop.call_soon_threadsafe` only if a
+    coroutine is waiting for a frame.
+
+    Args:
+        loop (event loop or None): the event loop which will retrieve frames.
+            If None, the loop running the first call to :py:meth:`.get` is
+            used.
+        maxsize (int): the maximum number of frames queued.
+        policy (:py:class:`freenect2.DropPolicy`): what to do with a new frame
+            if the queue is full.
+
+    """
+    def __init__(self, loop=None, maxsize=16, policy=DropPolicy.DropOldest):
+        self._loop = loop
+        self._queue = _DropQueue(maxsize, policy)
+        self._frame_ready = None
+        self._waiting = False
+
+    def __call__(self, frame_type, frame):
+        self._queue.put((frame_type, frame), frame_type)
+        if self._waiting:
+            self._waiting = False
+            self._loop.call_soon_threadsafe(self._frame_ready.set)
+
+    async def get(self, timeout=None):
+        """Coroutine which returns the next :py:class:`freenect2.FrameType`,
+        :py:class:`freenect2.Frame` tuple. Raises
+        :py:class:`freenect2.NoFrameReceivedError` if no frame arrives within
+        *timeout* seconds."""
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        if self._frame_ready is None:
+            self._frame_ready = asyncio.Event()
+
+        while True:
+            try:
+                return self._queue.get(False)
+            except Empty:
+                pass
+
+            self._frame_ready.clear()
+            self._waiting = True
+
+            # A frame may have been queued before the listener thread saw that
+            # we are waiting.
+            if self._queue.qsize() > 0:
+                self._waiting = False
+                continue
+
+            try:
+                await asyncio.wait_for(self._frame_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                self._waiting = False
+                raise NoFrameReceivedError()
+
+    def qsize(self):
+        """The number of frames currently queued."""
+        return self._queue.qsize()
+
+    @property
+    def dropped(self):
+        """A dict mapping each :py:class:`freenect2.FrameType` to the number of
+        frames of that type which have been discarded."""
+        dropped = dict((t, 0) for t in FrameType)
+        dropped.update(self._queue.dropped)
+        return dropped
+
+class _FrameIterator(object):
+    def __init__(self, listener, timeout):
+        self._listener = listener
+        self._timeout = timeout
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._listener.get(self._timeout)
+
+def _get_listener(device):
+    """Return the :py:class:`.AsyncFrameListener` installed on *device*,
+    installing a new one if necessary."""
+    listener = device.color_frame_listener
+    if not isinstance(listener, AsyncFrameListener):
+        listener = device.ir_and_depth_frame_listener
+    if not isinstance(listener, AsyncFrameListener):
+        listener = AsyncFrameListener()
+        device.color_frame_listener = listener
+        device.ir_and_depth_frame_listener = listener
+    return listener
+
+def aiter_frames(device, timeout=None):
+    """Implementation of :py:meth:`freenect2.Device.aiter`."""
+    return _FrameIterator(_get_listener(device), timeout)
+
+def next_frame(device, timeout=None):
+    """Implementation of :py:meth:`freenect2.Device.next_frame`."""
+    return _get_listener(device).get(timeout)
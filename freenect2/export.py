@@ -0,0 +1,335 @@
+"""
+Convert many depth and color frames to point clouds in parallel.
+
+The conversion is spread over a :py:class:`multiprocessing.Pool`. Each worker
+process builds its own :py:class:`freenect2.Registration` from the pickled
+camera calibration with :py:meth:`freenect2.Registration.from_params`. When
+converting a recording, each worker also opens the recording itself and so
+frames are never sent between processes.
+
+.. code::
+
+    from freenect2.export import export_ply, export_npy
+
+    # One binary PLY file per depth frame in a recording
+    paths = export_ply('capture.fn2', 'clouds/cloud-{:05d}.ply')
+
+    # All clouds in one memory-mapped .npy array
+    points = export_npy('capture.fn2', 'points.npy', colors_path='colors.npy')
+
+"""
+import itertools
+import multiprocessing
+
+import numpy as np
+
+from . import Frame, FrameFormat, FrameType, Registration, _timestamp_delta
+from .recording import RecordingError, RecordingReader, _as_path
+
+__all__ = (
+    'export_ply',
+    'export_npy',
+    'write_ply',
+)
+
+def write_ply(file_object, points, colors=None):
+    """Write points and (optionally) colors to a binary PLY file.
+
+    .. note::
+
+        Under Python 3 the file object *must* be opened in binary mode.
+
+    Args:
+        file_object (file): A file object to write PLY data to
+        points (array): An Nx3 array of 3d points.
+        colors (array or None): if not-None, an Nx3 array of 8-bit red, green
+            and blue values for each point.
+    """
+    points = np.asarray(points)
+    if len(points.shape) != 2 or points.shape[1] != 3:
+        raise ValueError('Expected an Nx3 array of points')
+    fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    if colors is not None:
+        if colors.shape != points.shape:
+            raise ValueError('Expected an Nx3 array of colors')
+        fields.extend([('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+
+    data = np.empty(points.shape[0], dtype=np.dtype(fields))
+    for idx, name in enumerate('xyz'):
+        data[name] = points[:, idx]
+    if colors is not None:
+        for idx, name in enumerate(('red', 'green', 'blue')):
+            data[name] = colors[:, idx]
+
+    file_object.write(b'ply\nformat binary_little_endian 1.0\n')
+    file_object.write('element vertex {}\n'.format(len(data)).encode())
+    for name, dtype in fields:
+        file_object.write('property {} {}\n'.format(
+            'float' if dtype == '<f4' else 'uchar', name).encode())
+    file_object.write(b'end_header\n')
+    file_object.write(np.ascontiguousarray(data).view(np.uint8))
+
+def _pair_recording_frames(reader, with_color, tolerance):
+    """Return a list of depth frame index, color frame index or None tuples
+    for a recording. Each depth frame is paired with the color frame nearest
+    in time. Depth frames without a color frame within *tolerance* are
+    omitted if *with_color* is true."""
+    frame_types, timestamps = reader.frame_types, reader.timestamps
+    colors = [
+        idx for idx, t in enumerate(frame_types) if t is FrameType.Color]
+
+    pairs = []
+    color_idx = 0
+    for idx, frame_type in enumerate(frame_types):
+        if frame_type is not FrameType.Depth:
+            continue
+        if not with_color:
+            pairs.append((idx, None))
+            continue
+
+        def distance(color_idx):
+            return abs(_timestamp_delta(
+                timestamps[colors[color_idx]], timestamps[idx]))
+
+        # Both streams are in recording order and so the nearest color frame
+        # never moves backwards.
+        while color_idx + 1 < len(colors) and (
+                distance(color_idx + 1) <= distance(color_idx)):
+            color_idx += 1
+        if len(colors) > 0 and distance(color_idx) <= tolerance:
+            pairs.append((idx, colors[color_idx]))
+
+    return pairs
+
+def _prepare(source, ir_camera_params, color_camera_params, with_color,
+             tolerance):
+    """Return an iterable of jobs, the recording path or None and the
+    calibration for *source*. Jobs for a sequence of frames are generated
+    lazily so that only those being processed are held in memory."""
+    path = _as_path(source)
+    if path is not None:
+        with RecordingReader(path) as reader:
+            jobs = _pair_recording_frames(reader, with_color, tolerance)
+            if ir_camera_params is None:
+                ir_camera_params = reader.ir_camera_params
+            if color_camera_params is None:
+                color_camera_params = reader.color_camera_params
+        recording_path = path
+    else:
+        jobs = (
+            (_frame_to_array(depth),
+             _frame_to_array(rgb) if with_color else None)
+            for depth, rgb in source
+        )
+        recording_path = None
+
+    if ir_camera_params is None or color_camera_params is None:
+        raise RecordingError('Camera calibration is required for export')
+
+    return jobs, recording_path, (ir_camera_params, color_camera_params)
+
+def _frame_to_array(frame):
+    # Frames cannot be sent to worker processes but numpy arrays can. The
+    # copy does not depend on the frame staying alive until it is sent.
+    if isinstance(frame, Frame):
+        return np.array(frame.to_array())
+    return frame
+
+# State of a worker process set by _init_worker.
+_worker = {}
+
+def _init_worker(calibration, recording_path, enable_filter):
+    _worker['registration'] = Registration.from_params(*calibration)
+    _worker['reader'] = (
+        None if recording_path is None else RecordingReader(recording_path))
+    _worker['enable_filter'] = enable_filter
+    _worker['memmaps'] = {}
+    _worker['out'] = None
+    _worker['undistorted'] = None
+
+def _load_frame(source, format_):
+    """Return a frame from a recording index or an array."""
+    if isinstance(source, int):
+        return _worker['reader'][source][1]
+    return Frame.from_array(np.ascontiguousarray(source), format_)
+
+def _compute_cloud(depth_source, color_source):
+    """Return 424x512x3 points and, if there is a color source, 424x512x3 RGB
+    colors."""
+    registration = _worker['registration']
+    depth = _load_frame(depth_source, FrameFormat.Float)
+
+    if color_source is None:
+        undistorted = registration.undistort_depth(
+            depth, out=_worker['undistorted'])
+        _worker['undistorted'] = undistorted
+        return registration.get_points_xyz_array(undistorted), None
+
+    rgb = _load_frame(color_source, FrameFormat.BGRX)
+    out = registration.apply(
+        rgb, depth, enable_filter=_worker['enable_filter'], out=_worker['out'])
+    _worker['out'] = out
+    undistorted, registered = out[:2]
+
+    points = registration.get_points_xyz_array(undistorted)
+    colors = registered.to_array()[..., 2::-1]
+    return points, colors
+
+def _export_ply_job(args):
+    path, depth_source, color_source, skip_invalid = args
+    points, colors = _compute_cloud(depth_source, color_source)
+    points = points.reshape((-1, 3))
+    if colors is not None:
+        colors = colors.reshape((-1, 3))
+    if skip_invalid:
+        valid = np.isfinite(points[:, 2])
+        points = points[valid]
+        colors = None if colors is None else colors[valid]
+    with open(path, 'wb') as fobj:
+        write_ply(fobj, points, colors)
+    return path
+
+def _open_memmap(path):
+    memmap = _worker['memmaps'].get(path)
+    if memmap is None:
+        memmap = np.load(path, mmap_mode='r+')
+        _worker['memmaps'][path] = memmap
+    return memmap
+
+def _export_npy_job(args):
+    index, points_path, colors_path, depth_source, color_source = args
+    points, colors = _compute_cloud(depth_source, color_source)
+    _open_memmap(points_path)[index] = points
+    if colors_path is not None:
+        _open_memmap(colors_path)[index] = colors
+    return index
+
+def _run(jobs, job_func, processes, recording_path, calibration,
+         enable_filter, chunksize):
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(
+        processes, initializer=_init_worker,
+        initargs=(calibration, recording_path, enable_filter))
+
+    # Pool.imap reads its whole input at once and so jobs are submitted in
+    # batches to bound the number of frames held in memory. The next batch is
+    # submitted before the results of the current one are collected so that
+    # workers are not left idle between batches.
+    jobs = iter(jobs)
+    batch_size = 2 * processes * chunksize
+    results = []
+    try:
+        pending = None
+        while True:
+            batch = list(itertools.islice(jobs, batch_size))
+            submitted = (
+                pool.imap(job_func, batch, chunksize) if len(batch) > 0
+                else None)
+            del batch
+            if pending is not None:
+                results.extend(pending)
+            if submitted is None:
+                break
+            pending = submitted
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def export_ply(source, path_pattern, ir_camera_params=None,
+               color_camera_params=None, with_color=True, skip_invalid=True,
+               enable_filter=True, tolerance=160, processes=None, chunksize=1):
+    """Write a binary PLY point cloud for each depth frame.
+
+    Args:
+        source (str, path-like or iterable): the path to a recording made with
+            :py:class:`freenect2.recording.Recorder` or an iterable of depth,
+            color pairs. Each depth is a 512x424 :py:class:`freenect2.Frame`
+            or float32 array and each color is a 1920x1080 BGRX
+            :py:class:`freenect2.Frame` or 1080x1920x4 uint8 array. Pairs are
+            read from the iterable as they are needed and so it may be a
+            generator.
+        path_pattern (str): a pattern formatted with the index of each cloud
+            to give the path of its PLY file.
+        ir_camera_params (:py:class:`freenect2.IrCameraParams` or None): IR
+            camera calibration. Required unless it is saved in the recording.
+        color_camera_params (:py:class:`freenect2.ColorCameraParams` or None):
+            color camera calibration. Required unless it is saved in the
+            recording.
+        with_color (bool): if true, color each point with the registered
+            color frame.
+        skip_invalid (bool): if true, omit points without a valid depth.
+        enable_filter (bool): as for :py:meth:`freenect2.Registration.apply`.
+        tolerance (int): when reading a recording, the largest difference in
+            timestamps between depth and color frames which are paired. Depth
+            frames without a matching color frame are skipped if *with_color*
+            is true.
+        processes (int or None): the number of worker processes. If None,
+            the number of CPUs is used.
+        chunksize (int): the number of clouds sent to a worker at once.
+
+    Returns:
+        A list of the paths written.
+
+    """
+    jobs, recording_path, calibration = _prepare(
+        source, ir_camera_params, color_camera_params, with_color, tolerance)
+    jobs = (
+        (path_pattern.format(idx), depth, rgb, skip_invalid)
+        for idx, (depth, rgb) in enumerate(jobs)
+    )
+    return _run(
+        jobs, _export_ply_job, processes, recording_path, calibration,
+        enable_filter, chunksize)
+
+def export_npy(source, points_path, colors_path=None, ir_camera_params=None,
+               color_camera_params=None, enable_filter=True, tolerance=160,
+               processes=None, chunksize=1):
+    """Write point clouds for every depth frame to a single ``.npy`` file.
+    The file is created with the shape of the full output and each worker
+    writes its clouds directly into it via a memory map.
+
+    Args:
+        source (str, path-like or sequence): as for :py:func:`.export_ply`
+            except that a source which is not a recording must have a length.
+        points_path (str): path of an ``.npy`` file to hold an Nx424x512x3
+            float32 array of points. Invalid points are NaN.
+        colors_path (str or None): if not-None, path of an ``.npy`` file to
+            hold an Nx424x512x3 uint8 array of registered RGB colors.
+        ir_camera_params: as for :py:func:`.export_ply`.
+        color_camera_params: as for :py:func:`.export_ply`.
+        enable_filter (bool): as for :py:meth:`freenect2.Registration.apply`.
+        tolerance (int): as for :py:func:`.export_ply`.
+        processes (int or None): as for :py:func:`.export_ply`.
+        chunksize (int): as for :py:func:`.export_ply`.
+
+    Returns:
+        The points array opened read-only as a memory map.
+
+    """
+    with_color = colors_path is not None
+    if _as_path(source) is None:
+        n_jobs = len(source)
+    jobs, recording_path, calibration = _prepare(
+        source, ir_camera_params, color_camera_params, with_color, tolerance)
+    if recording_path is not None:
+        n_jobs = len(jobs)
+
+    np.lib.format.open_memmap(
+        points_path, mode='w+', dtype=np.float32,
+        shape=(n_jobs, 424, 512, 3))
+    if with_color:
+        np.lib.format.open_memmap(
+            colors_path, mode='w+', dtype=np.uint8,
+            shape=(n_jobs, 424, 512, 3))
+
+    jobs = (
+        (idx, points_path, colors_path, depth, rgb)
+        for idx, (depth, rgb) in enumerate(jobs)
+    )
+    _run(
+        jobs, _export_npy_job, processes, recording_path, calibration,
+        enable_filter, chunksize)
+
+    return np.load(points_path, mmap_mode='r')
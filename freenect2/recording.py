@@ -0,0 +1,391 @@
+"""
+Record frames from a device to an indexed container file and read them back.
+
+A recording is a single file containing a short header, the raw buffer of each
+frame preceded by a fixed-size record header with the frame's metadata, an
+index of the records and a JSON metadata block describing the recording. The
+index and metadata are written when the recording is closed. If a recording was
+not closed cleanly, :py:class:`.RecordingReader` rebuilds the index by scanning
+the records.
+
+.. code::
+
+    from freenect2 import Device
+    from freenect2.recording import Recorder
+
+    device = Device()
+    with Recorder('capture.fn2', device=device) as recorder:
+        with device.running(recorder):
+            time.sleep(10)
+
+"""
+import io
+import json
+from queue import Empty
+import struct
+import threading
+
+from . import (
+    ColorCameraParams, DropPolicy, Frame, FrameFormat, FrameType,
+    IrCameraParams, _DropQueue)
+from .codec import decode_depth, encode_depth
+
+__all__ = (
+    'Recorder',
+    'RecordingReader',
+    'RecordingError',
+)
+
+_FILE_MAGIC = b'FN2REC01'
+_FOOTER_MAGIC = b'FN2IDX01'
+
+# frame type, format, flags, width, height, bytes per pixel, timestamp,
+# sequence, exposure, gain, gamma, status, data size
+_RECORD_HEADER = struct.Struct('<BBHIIIIIfffIQ')
+
+# Record flag set if the data is depth compressed by freenect2.codec
+_FLAG_COMPRESSED_DEPTH = 0x1
+
+# record offset, frame type, format, reserved, timestamp, sequence
+_INDEX_ENTRY = struct.Struct('<QBBHII')
+
+# index offset, number of entries, metadata offset, metadata size, magic
+_FOOTER = struct.Struct('<QQQQ8s')
+
+def _as_path(file_or_path):
+    """Return *file_or_path* as a str if it is a str or a path-like object
+    such as a :py:class:`pathlib.Path` or None otherwise."""
+    if hasattr(file_or_path, '__fspath__'):
+        file_or_path = file_or_path.__fspath__()
+    return file_or_path if isinstance(file_or_path, str) else None
+
+class RecordingError(RuntimeError):
+    """Raised when a recording cannot be written or is not a valid recording
+    file."""
+    pass
+
+class Recorder(object):
+    """A frame listener which records frames to an indexed container file.
+
+    Frames passed to the recorder are queued in memory and written to disk by
+    a background thread so that capture never waits for the disk. If the writer
+    falls behind, frames are discarded according to *policy* and counted in
+    :py:attr:`.dropped`. The frame buffers themselves are not copied; each
+    queued :py:class:`.Frame` is written directly to the file.
+
+    Call :py:meth:`.close` when recording is finished to flush the queue and
+    write the index. Recorders may also be used as context managers.
+
+    Args:
+        file_or_path (file or str): a path or a file object opened in binary
+            mode.
+        device (:py:class:`.Device` or None): if not-None, the device being
+            recorded. Its camera calibration is saved when the recording is
+            closed.
+        frame_types (sequence or None): if not-None, only frames of these
+            :py:class:`.FrameType` values are recorded.
+        maxsize (int): the maximum number of frames waiting to be written.
+        policy (:py:class:`.DropPolicy`): what to do with a new frame if
+            *maxsize* frames are already waiting.
+        metadata (dict or None): additional JSON-serialisable values saved
+            with the recording.
+        compress_depth (bool): if true, depth frames are compressed
+            losslessly with :py:func:`freenect2.codec.encode_depth` by the
+            writer thread. Depths are rounded to whole millimetres.
+
+    .. py:attribute:: ir_camera_params
+
+        (:py:class:`.IrCameraParams` or None) IR camera calibration saved with
+        the recording. Set from *device* on :py:meth:`.close` if not-None.
+
+    .. py:attribute:: color_camera_params
+
+        (:py:class:`.ColorCameraParams` or None) Color camera calibration
+        saved with the recording. Set from *device* on :py:meth:`.close` if
+        not-None.
+
+    .. py:attribute:: frames_written
+
+        (int) Number of frames written so far.
+
+    """
+    def __init__(self, file_or_path, device=None, frame_types=None,
+                 maxsize=64, policy=DropPolicy.DropOldest, metadata=None,
+                 compress_depth=False):
+        if hasattr(file_or_path, 'write'):
+            self._file, self._owns_file = file_or_path, False
+        else:
+            self._file, self._owns_file = io.open(file_or_path, 'wb'), True
+
+        self.device = device
+        self.frame_types = None if frame_types is None else frozenset(
+            FrameType(t) for t in frame_types)
+        self.metadata = dict(metadata or {})
+        self.compress_depth = compress_depth
+        self.ir_camera_params = None
+        self.color_camera_params = None
+        self.frames_written = 0
+
+        self._queue = _DropQueue(maxsize, policy)
+        self._index = []
+        self._closed = False
+        self._error = None
+
+        self._file.write(_FILE_MAGIC)
+        self._offset = len(_FILE_MAGIC)
+
+        self._writer = threading.Thread(target=self._write_frames)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def __call__(self, frame_type, frame):
+        if self.frame_types is not None and frame_type not in self.frame_types:
+            return
+        self._queue.put((frame_type, frame), frame_type)
+
+    @property
+    def dropped(self):
+        """A dict mapping each :py:class:`.FrameType` to the number of frames
+        of that type discarded because the writer fell behind."""
+        dropped = dict((t, 0) for t in FrameType)
+        dropped.update(self._queue.dropped)
+        return dropped
+
+    def qsize(self):
+        """The number of frames waiting to be written."""
+        return self._queue.qsize()
+
+    def _write_frames(self):
+        try:
+            while True:
+                try:
+                    frame_type, frame = self._queue.get(True, 0.1)
+                except Empty:
+                    if self._closed:
+                        return
+                    continue
+                self._write_frame(frame_type, frame)
+        except Exception as e:
+            self._error = e
+
+    def _write_frame(self, frame_type, frame):
+        flags = 0
+        if self.compress_depth and frame_type is FrameType.Depth:
+            data = encode_depth(frame)
+            flags |= _FLAG_COMPRESSED_DEPTH
+        else:
+            data = frame.data
+        header = _RECORD_HEADER.pack(
+            frame_type.value, frame.format.value, flags, frame.width,
+            frame.height, frame.bytes_per_pixel, frame.timestamp,
+            frame.sequence, frame.exposure, frame.gain, frame.gamma,
+            frame.status, len(data))
+        self._file.write(header)
+        self._file.write(data)
+        self._index.append(_INDEX_ENTRY.pack(
+            self._offset, frame_type.value, frame.format.value, 0,
+            frame.timestamp, frame.sequence))
+        self._offset += len(header) + len(data)
+        self.frames_written += 1
+
+    def close(self):
+        """Wait for queued frames to be written, write the index and close the
+        file. Raises :py:class:`.RecordingError` if the writer thread failed."""
+        if self._closed:
+            return
+        self._closed = True
+        self._writer.join()
+
+        if self.device is not None:
+            if self.device.ir_camera_params is not None:
+                self.ir_camera_params = self.device.ir_camera_params
+            if self.device.color_camera_params is not None:
+                self.color_camera_params = self.device.color_camera_params
+
+        try:
+            if self._error is not None:
+                raise RecordingError(
+                    'Error writing recording: {}'.format(self._error))
+
+            index_offset = self._offset
+            self._file.write(b''.join(self._index))
+
+            metadata_offset = index_offset + len(self._index) * _INDEX_ENTRY.size
+            metadata = json.dumps({
+                'ir_camera_params': (
+                    None if self.ir_camera_params is None
+                    else self.ir_camera_params.to_dict()),
+                'color_camera_params': (
+                    None if self.color_camera_params is None
+                    else self.color_camera_params.to_dict()),
+                'metadata': self.metadata,
+            }).encode('utf8')
+            self._file.write(metadata)
+
+            self._file.write(_FOOTER.pack(
+                index_offset, len(self._index), metadata_offset,
+                len(metadata), _FOOTER_MAGIC))
+            self._file.flush()
+        finally:
+            if self._owns_file:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class RecordingReader(object):
+    """Read frames from a recording written by :py:class:`.Recorder`.
+
+    Frames may be retrieved by index or by iterating over the reader. Each
+    frame is read from the file directly into a newly allocated
+    :py:class:`.Frame`.
+
+    Args:
+        file_or_path (file or str): a path or a file object opened in binary
+            mode.
+
+    .. py:attribute:: ir_camera_params
+
+        (:py:class:`.IrCameraParams` or None) IR camera calibration saved with
+        the recording.
+
+    .. py:attribute:: color_camera_params
+
+        (:py:class:`.ColorCameraParams` or None) Color camera calibration
+        saved with the recording.
+
+    .. py:attribute:: metadata
+
+        (dict) Additional metadata saved with the recording.
+
+    """
+    def __init__(self, file_or_path):
+        if hasattr(file_or_path, 'read'):
+            self._file, self._owns_file = file_or_path, False
+        else:
+            self._file, self._owns_file = io.open(file_or_path, 'rb'), True
+        self._lock = threading.Lock()
+
+        self._file.seek(0)
+        if self._file.read(len(_FILE_MAGIC)) != _FILE_MAGIC:
+            raise RecordingError('Not a freenect2 recording')
+
+        metadata = self._read_footer()
+        if metadata is None:
+            metadata = {}
+            self._scan_records()
+
+        ir_params = metadata.get('ir_camera_params')
+        self.ir_camera_params = (
+            None if ir_params is None else IrCameraParams.from_dict(ir_params))
+        color_params = metadata.get('color_camera_params')
+        self.color_camera_params = (
+            None if color_params is None
+            else ColorCameraParams.from_dict(color_params))
+        self.metadata = metadata.get('metadata', {})
+
+    def _read_footer(self):
+        """Load the index and return the metadata dict from the footer or
+        return None if the footer is missing."""
+        self._file.seek(0, io.SEEK_END)
+        size = self._file.tell()
+        if size < len(_FILE_MAGIC) + _FOOTER.size:
+            return None
+        self._file.seek(size - _FOOTER.size)
+        (index_offset, n_entries, metadata_offset, metadata_size,
+         magic) = _FOOTER.unpack(self._file.read(_FOOTER.size))
+        if magic != _FOOTER_MAGIC:
+            return None
+
+        self._file.seek(index_offset)
+        index = self._file.read(n_entries * _INDEX_ENTRY.size)
+        self._entries = [
+            _INDEX_ENTRY.unpack_from(index, idx * _INDEX_ENTRY.size)
+            for idx in range(n_entries)
+        ]
+
+        self._file.seek(metadata_offset)
+        return json.loads(self._file.read(metadata_size).decode('utf8'))
+
+    def _scan_records(self):
+        """Rebuild the index of a recording which was not closed cleanly."""
+        self._entries = []
+        # Seeking past the end of a file succeeds and so a record cut off
+        # while it was written is detected by comparing with the file size.
+        self._file.seek(0, io.SEEK_END)
+        size = self._file.tell()
+        offset = len(_FILE_MAGIC)
+        while offset + _RECORD_HEADER.size <= size:
+            self._file.seek(offset)
+            fields = _RECORD_HEADER.unpack(
+                self._file.read(_RECORD_HEADER.size))
+            data_size = fields[-1]
+            if offset + _RECORD_HEADER.size + data_size > size:
+                break
+            self._entries.append(
+                (offset, fields[0], fields[1], 0, fields[6], fields[7]))
+            offset += _RECORD_HEADER.size + data_size
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def frame_types(self):
+        """A list giving the :py:class:`.FrameType` of each frame in the
+        recording."""
+        return [FrameType(e[1]) for e in self._entries]
+
+    @property
+    def timestamps(self):
+        """A list giving the timestamp of each frame in the recording."""
+        return [e[4] for e in self._entries]
+
+    def __getitem__(self, idx):
+        """Read a frame. Returns a :py:class:`.FrameType`,
+        :py:class:`.Frame` tuple."""
+        offset = self._entries[idx][0]
+        with self._lock:
+            self._file.seek(offset)
+            (frame_type, format_, flags, width, height, bytes_per_pixel,
+             timestamp, sequence, exposure, gain, gamma, status,
+             data_size) = _RECORD_HEADER.unpack(
+                 self._file.read(_RECORD_HEADER.size))
+
+            frame = Frame.create(width, height, bytes_per_pixel)
+            if flags & _FLAG_COMPRESSED_DEPTH:
+                data = self._file.read(data_size)
+                if len(data) != data_size:
+                    raise RecordingError('Recording is truncated')
+            elif self._file.readinto(frame.data) != data_size:
+                raise RecordingError('Recording is truncated')
+
+        if flags & _FLAG_COMPRESSED_DEPTH:
+            decode_depth(data, out=frame)
+
+        frame.format = FrameFormat(format_)
+        frame.timestamp = timestamp
+        frame.sequence = sequence
+        frame.exposure = exposure
+        frame.gain = gain
+        frame.gamma = gamma
+        frame.status = status
+
+        return FrameType(frame_type), frame
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def close(self):
+        """Close the underlying file."""
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
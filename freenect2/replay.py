@@ -0,0 +1,368 @@
+"""
+Devices which produce frames without Kinect hardware.
+
+A :py:class:`.ReplayDevice` implements the :py:class:`freenect2.Device`
+interface but plays back frames from a recording made with
+:py:class:`freenect2.recording.Recorder` or generates a synthetic scene. This
+allows processing pipelines to be benchmarked and tested on machines without a
+device attached.
+
+.. code::
+
+    from freenect2.replay import ReplayDevice
+
+    # Play back a recording as fast as possible
+    device = ReplayDevice('capture.fn2', realtime=False)
+    with device.running():
+        for frame_set in device.framesets():
+            undistorted, registered = device.registration.apply(
+                frame_set.color, frame_set.depth)
+
+"""
+import threading
+import traceback
+
+import numpy as np
+
+from . import (
+    ColorCameraParams, Device, DropPolicy, Frame, FrameFormat, FrameType,
+    IrCameraParams, NoFrameReceivedError, _monotonic, _timestamp_delta)
+from .recording import RecordingReader, _as_path
+
+__all__ = (
+    'ReplayDevice',
+)
+
+#: Calibration used for synthetic frames. The values are typical of a
+#: Kinect v2 with the color polynomial reduced to a linear mapping.
+SYNTHETIC_IR_CAMERA_PARAMS = IrCameraParams(
+    fx=365.5, fy=365.5, cx=256.0, cy=212.0)
+
+#: See :py:data:`.SYNTHETIC_IR_CAMERA_PARAMS`.
+SYNTHETIC_COLOR_CAMERA_PARAMS = ColorCameraParams(
+    fx=1081.37, fy=1081.37, cx=959.5, cy=539.5, shift_d=863.0, shift_m=52.0,
+    mx_x1y0=0.651, my_x0y1=0.651)
+
+class _SyntheticScene(object):
+    """Generate depth, IR and color frames showing a plane with a bump and a
+    bar which move across the field of view."""
+    def __init__(self, fps):
+        self.fps = fps
+        self.tick = 0
+
+        ys, xs = np.mgrid[:424, :512].astype(np.float32)
+        self._xs, self._ys = xs, ys
+        self._plane = 2000 + 2 * ys
+
+        color = np.zeros((1080, 1920, 4), dtype=np.uint8)
+        color[..., 0] = np.linspace(0, 255, 1920)[np.newaxis, :]
+        color[..., 1] = np.linspace(0, 255, 1080)[:, np.newaxis]
+        color[..., 2] = 128
+        self._color = color
+
+    def next_frames(self, color=True, depth=True):
+        """Return a list of :py:class:`.FrameType`, :py:class:`.Frame` tuples
+        for the next instant. Frames of streams which are not requested are not
+        generated."""
+        phase = 2 * np.pi * self.tick / (4 * self.fps)
+        timestamp = int(self.tick * 10000 / self.fps) & 0xffffffff
+        frames = []
+        if color:
+            frames.append((FrameType.Color, self._next_color(phase)))
+        if depth:
+            frames.extend(self._next_ir_and_depth(phase))
+        for _, frame in frames:
+            frame.timestamp = timestamp
+            frame.sequence = self.tick
+        self.tick += 1
+
+        return frames
+
+    def _next_ir_and_depth(self, phase):
+        depth = _create_frame(512, 424, FrameFormat.Float)
+        depth_array = depth.to_array()
+        bump_x = 256 + 150 * np.sin(phase)
+        np.subtract(self._plane, 500 * np.exp(
+            -((self._xs - bump_x) ** 2 + (self._ys - 212) ** 2) / 3200),
+            out=depth_array)
+
+        ir = _create_frame(512, 424, FrameFormat.Float)
+        ir_array = ir.to_array()
+        np.divide(2e11, np.square(depth_array), out=ir_array)
+        np.minimum(ir_array, 65535, out=ir_array)
+
+        return [(FrameType.Ir, ir), (FrameType.Depth, depth)]
+
+    def _next_color(self, phase):
+        color = _create_frame(1920, 1080, FrameFormat.BGRX)
+        color_array = color.to_array()
+        np.copyto(color_array, self._color)
+        bar_x = int(940 + 800 * np.sin(phase))
+        color_array[:, bar_x:bar_x+40, :3] = 255
+
+        return color
+
+def _create_frame(width, height, format_):
+    frame = Frame.create(width, height, 4)
+    frame.format = format_
+    return frame
+
+class ReplayDevice(Device):
+    """A :py:class:`freenect2.Device` which plays back a recording or
+    generates synthetic frames.
+
+    Frames are delivered from a background thread to
+    :py:attr:`.color_frame_listener` and :py:attr:`.ir_and_depth_frame_listener`
+    exactly as they would be from a real device and so
+    :py:meth:`.get_next_frame`, :py:meth:`.framesets` and iteration work as
+    usual. Once playback has finished and every frame has been retrieved,
+    :py:meth:`.get_next_frame` raises :py:class:`freenect2.NoFrameReceivedError`
+    rather than waiting and iteration over the device or its frame sets stops.
+
+    Args:
+        source (str, path-like, :py:class:`freenect2.recording.RecordingReader`
+            or None): a recording or path to a recording to play back. If
+            None, a synthetic scene is generated.
+        realtime (bool): if true, frames are delivered at the rate they were
+            recorded (or at *fps* for synthetic frames). If false, frames are
+            delivered as fast as possible.
+        speed (number): when *realtime* is true, a multiplier for the rate at
+            which frames are delivered.
+        fps (number): rate at which synthetic frames are generated.
+        loop (bool): if true, restart the recording when it finishes.
+        max_frames (int or None): if not-None, stop after playing back this
+            many frames of any type, including frames removed by
+            :py:meth:`freenect2.Device.set_frame_filter`.
+        ir_camera_params (:py:class:`freenect2.IrCameraParams` or None): if
+            not-None, overrides the IR calibration from the recording.
+        color_camera_params (:py:class:`freenect2.ColorCameraParams` or None):
+            if not-None, overrides the color calibration from the recording.
+        queue_size (int): as for :py:class:`freenect2.Device`.
+        drop_policy (:py:class:`freenect2.DropPolicy`): as for
+            :py:class:`freenect2.Device`.
+
+    When generating synthetic frames, the calibration defaults to
+    :py:data:`.SYNTHETIC_IR_CAMERA_PARAMS` and
+    :py:data:`.SYNTHETIC_COLOR_CAMERA_PARAMS`.
+
+    """
+    def __init__(self, source=None, realtime=True, speed=1.0, fps=30.0,
+                 loop=False, max_frames=None, ir_camera_params=None,
+                 color_camera_params=None, queue_size=16,
+                 drop_policy=DropPolicy.DropOldest):
+        # Device.__init__ is not called since it opens a hardware device.
+        self._owns_source = False
+        if _as_path(source) is not None:
+            source, self._owns_source = RecordingReader(_as_path(source)), True
+        self._source = source
+
+        self.realtime = realtime
+        self.speed = speed
+        self.fps = fps
+        self.loop = loop
+        self.max_frames = max_frames
+
+        if source is None:
+            default_ir = SYNTHETIC_IR_CAMERA_PARAMS
+            default_color = SYNTHETIC_COLOR_CAMERA_PARAMS
+        else:
+            default_ir = getattr(source, 'ir_camera_params', None)
+            default_color = getattr(source, 'color_camera_params', None)
+        self._stored_ir_camera_params = (
+            ir_camera_params if ir_camera_params is not None else default_ir)
+        self._stored_color_camera_params = (
+            color_camera_params if color_camera_params is not None
+            else default_color)
+
+        self._streams = True, True
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._finished = threading.Event()
+
+        # Played back frames are not copied and so there is no frame pool.
+        self._init_capture(queue_size, drop_policy, pool_size=0)
+
+    @property
+    def color_frame_listener(self):
+        """A callable called whenever a new color frame is played back."""
+        return self._color_frame_listener
+
+    @color_frame_listener.setter
+    def color_frame_listener(self, value):
+        self._color_frame_listener = value
+
+    @property
+    def ir_and_depth_frame_listener(self):
+        """A callable called whenever a new IR or depth frame is played
+        back."""
+        return self._ir_and_depth_frame_listener
+
+    @ir_and_depth_frame_listener.setter
+    def ir_and_depth_frame_listener(self, value):
+        self._ir_and_depth_frame_listener = value
+
+    def _frame_filter_changed(self):
+        # Frames are filtered as they are played back.
+        pass
+
+    @property
+    def serial_number(self):
+        """Always None since there is no hardware device."""
+        return None
+
+    @property
+    def finished(self):
+        """True if playback has been started and has delivered every
+        frame."""
+        return self._finished.is_set()
+
+    def start(self, frame_listener=None, color=True, depth=True):
+        """Start playback from the beginning of the source.
+
+        Args:
+            frame_listener (callable or None): if not-None, this is a callable
+                which is assigned to both :py:attr:`.color_frame_listener` and
+                :py:attr:`.ir_and_depth_frame_listener` before playback
+                starts.
+            color (bool): if true, play back color frames.
+            depth (bool): if true, play back IR and depth frames.
+
+        """
+        if not color and not depth:
+            raise ValueError('At least one of color or depth must be started')
+
+        self.stop()
+        self._streams = color, depth
+        if frame_listener is not None:
+            self.color_frame_listener = frame_listener
+            self.ir_and_depth_frame_listener = frame_listener
+
+        self.color_camera_params = self._stored_color_camera_params
+        self.ir_camera_params = self._stored_ir_camera_params
+
+        self._stop_event.clear()
+        self._finished.clear()
+        self._thread = threading.Thread(target=self._play)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop playback."""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """Stop playback and close the source recording if it was opened by
+        this device."""
+        self.stop()
+        if self._owns_source:
+            self._source.close()
+
+    def _exhausted(self):
+        """True if playback has finished and the default listener is
+        empty."""
+        return self.finished and self._default_listener.qsize() == 0
+
+    def get_next_frame(self, timeout=None):
+        """As for :py:meth:`freenect2.Device.get_next_frame` but
+        :py:class:`freenect2.NoFrameReceivedError` is also raised once playback
+        has finished and every frame has been retrieved."""
+        deadline = None if timeout is None else _monotonic() + timeout
+        while True:
+            wait = 0.1
+            if deadline is not None:
+                wait = min(wait, max(0, deadline - _monotonic()))
+            try:
+                return Device.get_next_frame(self, wait)
+            except NoFrameReceivedError:
+                if self._exhausted() or (
+                        deadline is not None and _monotonic() >= deadline):
+                    raise
+
+    def framesets(self, timeout=None, **kwargs):
+        """As for :py:meth:`freenect2.Device.framesets` but the iterator stops
+        once playback has finished."""
+        framesets = Device.framesets(self, timeout, **kwargs)
+        def iterator():
+            while True:
+                try:
+                    frame_set = next(framesets)
+                except NoFrameReceivedError:
+                    if self._exhausted():
+                        return
+                    raise
+                yield frame_set
+        return iterator()
+
+    def __iter__(self):
+        def iterator():
+            while True:
+                try:
+                    yield self.get_next_frame()
+                except NoFrameReceivedError:
+                    return
+        return iterator()
+
+    def _frame_batches(self):
+        """Yield lists of frames which should be delivered at the same
+        instant along with the time in seconds at which to deliver them."""
+        if self._source is None:
+            scene = _SyntheticScene(self.fps)
+            while True:
+                yield (
+                    scene.tick / float(self.fps),
+                    scene.next_frames(*self._streams))
+
+        first_timestamp = None
+        while True:
+            for frame_type, frame in self._source:
+                if first_timestamp is None:
+                    first_timestamp = frame.timestamp
+                yield (
+                    1e-4 * _timestamp_delta(frame.timestamp, first_timestamp),
+                    [(frame_type, frame)])
+            if not self.loop or len(self._source) == 0:
+                return
+            first_timestamp = None
+
+    def _play(self):
+        color, depth = self._streams
+        n_frames = 0
+        counts = dict((t, 0) for t in FrameType)
+        start_time = _monotonic()
+        try:
+            for offset, frames in self._frame_batches():
+                if self.realtime:
+                    delay = start_time + offset / self.speed - _monotonic()
+                    if delay > 0 and self._stop_event.wait(delay):
+                        return
+                    if offset == 0:
+                        start_time = _monotonic()
+                if self._stop_event.is_set():
+                    return
+
+                for frame_type, frame in frames:
+                    if frame_type is FrameType.Color:
+                        if not color:
+                            continue
+                        listener = self.color_frame_listener
+                    else:
+                        if not depth:
+                            continue
+                        listener = self.ir_and_depth_frame_listener
+                    every, count = self._frame_filter[frame_type], counts[frame_type]
+                    counts[frame_type] += 1
+                    if listener is not None and every > 0 and count % every == 0:
+                        try:
+                            self._stats._deliver(listener, frame_type, frame)
+                        except Exception:
+                            traceback.print_exc()
+
+                    n_frames += 1
+                    if self.max_frames is not None and (
+                            n_frames >= self.max_frames):
+                        return
+        finally:
+            self._finished.set()
@@ -0,0 +1,374 @@
+"""
+Publish frames to other processes through shared memory. Requires Python 3.8
+or later.
+
+A :py:class:`.SharedFramePublisher` is a frame listener which copies each frame
+once into a ring of slots in a :py:class:`multiprocessing.shared_memory.SharedMemory`
+block. There is one ring per :py:class:`freenect2.FrameType` with slots sized
+from the frame geometry. Any number of worker processes may attach a
+:py:class:`.SharedFrameSubscriber` to the block by name and read frames as numpy
+arrays which are views onto the shared memory without further copying.
+
+.. code::
+
+    # In the capturing process
+    publisher = SharedFramePublisher(name='kinect')
+    with device.running(publisher):
+        ...
+
+    # In each worker process
+    subscriber = SharedFrameSubscriber('kinect')
+    while True:
+        frame = subscriber.get(FrameType.Depth)
+        process(frame.array)
+        if not frame.is_valid():
+            # The slot was overwritten while being processed
+            ...
+
+Each slot carries a version number which is odd while the publisher writes to
+it. Readers check the version before and after using a slot to detect frames
+which were overwritten because the reader fell too far behind. This relies on
+the publisher's writes becoming visible in order, as they do on x86.
+
+"""
+from multiprocessing import shared_memory
+import time
+
+import numpy as np
+
+from . import FrameFormat, FrameType, NoFrameReceivedError, _monotonic
+
+__all__ = (
+    'SharedFramePublisher',
+    'SharedFrameSubscriber',
+    'SharedFrame',
+    'DEFAULT_GEOMETRY',
+)
+
+#: Largest width, height and bytes per pixel of frames of each type.
+DEFAULT_GEOMETRY = {
+    FrameType.Color: (1920, 1080, 4),
+    FrameType.Ir: (512, 424, 4),
+    FrameType.Depth: (512, 424, 4),
+}
+
+_MAGIC = b'FN2SHM01'
+
+_HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'), ('n_rings', '<u4'), ('n_slots', '<u4'),
+])
+
+_RING_DTYPE = np.dtype([
+    ('frame_type', '<u4'), ('width', '<u4'), ('height', '<u4'),
+    ('bytes_per_pixel', '<u4'), ('slot_size', '<u8'), ('meta_offset', '<u8'),
+    ('data_offset', '<u8'), ('write_count', '<u8'),
+])
+
+_SLOT_DTYPE = np.dtype([
+    ('version', '<u8'), ('timestamp', '<u4'), ('sequence', '<u4'),
+    ('exposure', '<f4'), ('gain', '<f4'), ('gamma', '<f4'), ('status', '<u4'),
+    ('format', '<u4'), ('width', '<u4'), ('height', '<u4'),
+    ('bytes_per_pixel', '<u4'),
+])
+
+# Names of blocks created by publishers in this process. Subscribers must not
+# remove these from the resource tracker.
+_published_names = set()
+
+def _align(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+class _Ring(object):
+    """Views onto the shared memory for one frame type."""
+    def __init__(self, buf, descriptor, n_slots):
+        self.descriptor = descriptor
+        self.frame_type = FrameType(int(descriptor['frame_type']))
+        self.slot_size = int(descriptor['slot_size'])
+        self.n_slots = n_slots
+        self.slots = np.ndarray(
+            (n_slots,), dtype=_SLOT_DTYPE, buffer=buf,
+            offset=int(descriptor['meta_offset']))
+        self.data = np.ndarray(
+            (n_slots, self.slot_size), dtype=np.uint8, buffer=buf,
+            offset=int(descriptor['data_offset']))
+
+    @property
+    def write_count(self):
+        return int(self.descriptor['write_count'])
+
+def _map_rings(buf):
+    header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=buf)
+    if header['magic'] != _MAGIC:
+        raise ValueError('Shared memory does not contain a frame ring')
+    n_rings, n_slots = int(header['n_rings']), int(header['n_slots'])
+    descriptors = np.ndarray(
+        (n_rings,), dtype=_RING_DTYPE, buffer=buf,
+        offset=_align(_HEADER_DTYPE.itemsize))
+    rings = [_Ring(buf, descriptors[idx], n_slots) for idx in range(n_rings)]
+    return dict((ring.frame_type, ring) for ring in rings)
+
+class SharedFramePublisher(object):
+    """A frame listener which copies frames into shared memory rings.
+
+    Args:
+        name (str or None): the name of the shared memory block. If None, a
+            unique name is chosen. See :py:attr:`.name`.
+        n_slots (int): number of frames of each type held in the ring.
+        frame_types (sequence or None): the :py:class:`freenect2.FrameType`
+            values to publish. If None, every frame type is published.
+        geometry (dict or None): if not-None, a mapping from
+            :py:class:`freenect2.FrameType` to width, height and bytes per
+            pixel which overrides :py:data:`.DEFAULT_GEOMETRY`.
+
+    .. py:attribute:: oversized
+
+        (int) Number of frames not published because they were larger than a
+        slot.
+
+    """
+    def __init__(self, name=None, n_slots=4, frame_types=None, geometry=None):
+        frame_types = list(FrameType) if frame_types is None else [
+            FrameType(t) for t in frame_types]
+        frame_geometry = dict(DEFAULT_GEOMETRY)
+        frame_geometry.update(geometry or {})
+
+        # Lay out the header, ring descriptors, then the metadata and data for
+        # each ring.
+        offset = _align(_HEADER_DTYPE.itemsize)
+        offset = _align(offset + len(frame_types) * _RING_DTYPE.itemsize)
+        layout = []
+        for frame_type in frame_types:
+            width, height, bytes_per_pixel = frame_geometry[frame_type]
+            slot_size = _align(width * height * bytes_per_pixel)
+            meta_offset = offset
+            data_offset = _align(meta_offset + n_slots * _SLOT_DTYPE.itemsize)
+            offset = data_offset + n_slots * slot_size
+            layout.append((
+                frame_type.value, width, height, bytes_per_pixel, slot_size,
+                meta_offset, data_offset, 0))
+
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True, size=offset)
+        buf = self._shm.buf
+        header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=buf)
+        header['n_rings'] = len(frame_types)
+        header['n_slots'] = n_slots
+        descriptors = np.ndarray(
+            (len(frame_types),), dtype=_RING_DTYPE, buffer=buf,
+            offset=_align(_HEADER_DTYPE.itemsize))
+        descriptors[:] = layout
+        header['magic'] = _MAGIC
+
+        self._rings = _map_rings(buf)
+        self.oversized = 0
+        _published_names.add(self._shm._name)
+
+    @property
+    def name(self):
+        """The name of the shared memory block. Pass this to
+        :py:class:`.SharedFrameSubscriber`."""
+        return self._shm.name
+
+    def __call__(self, frame_type, frame):
+        ring = self._rings.get(frame_type)
+        if ring is None:
+            return
+
+        data = np.frombuffer(frame.data, dtype=np.uint8)
+        if data.shape[0] > ring.slot_size:
+            self.oversized += 1
+            return
+
+        # Only one libfreenect2 thread delivers each frame type and so each
+        # ring has a single writer.
+        index = ring.write_count
+        slot_idx = index % ring.n_slots
+        slot = ring.slots[slot_idx]
+        slot['version'] = 2 * index + 1
+        ring.data[slot_idx, :data.shape[0]] = data
+        slot['timestamp'] = frame.timestamp
+        slot['sequence'] = frame.sequence
+        slot['exposure'] = frame.exposure
+        slot['gain'] = frame.gain
+        slot['gamma'] = frame.gamma
+        slot['status'] = frame.status
+        slot['format'] = frame.format.value
+        slot['width'] = frame.width
+        slot['height'] = frame.height
+        slot['bytes_per_pixel'] = frame.bytes_per_pixel
+        slot['version'] = 2 * index + 2
+        ring.descriptor['write_count'] = index + 1
+
+    def close(self):
+        """Detach from and remove the shared memory block. Subscribers which
+        are still attached keep their mapping until they close."""
+        self._rings = {}
+        _published_names.discard(self._shm._name)
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class SharedFrame(object):
+    """A frame read from shared memory by a :py:class:`.SharedFrameSubscriber`.
+
+    .. py:attribute:: frame_type
+
+        (:py:class:`freenect2.FrameType`) The type of frame.
+
+    .. py:attribute:: index
+
+        (int) The number of frames of this type published before this one.
+
+    .. py:attribute:: array
+
+        (numpy array) A view onto the frame in shared memory shaped as for
+        :py:meth:`freenect2.Frame.to_array`. Frames in :py:attr:`.format`
+        *Raw* are a one dimensional array of bytes.
+
+    The :py:attr:`.timestamp`, :py:attr:`.sequence`, :py:attr:`.exposure`,
+    :py:attr:`.gain`, :py:attr:`.gamma`, :py:attr:`.status`, :py:attr:`.format`,
+    :py:attr:`.width`, :py:attr:`.height` and :py:attr:`.bytes_per_pixel`
+    attributes are copies of those of the published :py:class:`freenect2.Frame`.
+
+    """
+    def __init__(self, ring, index):
+        slot_idx = index % ring.n_slots
+        slot = ring.slots[slot_idx]
+        self._slot = slot
+        self._version = 2 * index + 2
+
+        self.frame_type = ring.frame_type
+        self.index = index
+        self.timestamp = int(slot['timestamp'])
+        self.sequence = int(slot['sequence'])
+        self.exposure = float(slot['exposure'])
+        self.gain = float(slot['gain'])
+        self.gamma = float(slot['gamma'])
+        self.status = int(slot['status'])
+        self.format = FrameFormat(int(slot['format']))
+        self.width = int(slot['width'])
+        self.height = int(slot['height'])
+        self.bytes_per_pixel = int(slot['bytes_per_pixel'])
+
+        data = ring.data[slot_idx, :self.width * self.height * self.bytes_per_pixel]
+        if self.format is FrameFormat.BGRX or self.format is FrameFormat.RGBX:
+            self.array = data.reshape((self.height, self.width, 4))
+        elif self.format is FrameFormat.Gray:
+            self.array = data.reshape((self.height, self.width))
+        elif self.format is FrameFormat.Float:
+            self.array = data.view(np.float32).reshape(
+                (self.height, self.width))
+        else:
+            self.array = data
+
+    def is_valid(self):
+        """Return True if the slot holding this frame has not been overwritten
+        since the frame was read. Call this after using :py:attr:`.array` to
+        check that the data did not change while it was in use."""
+        return int(self._slot['version']) == self._version
+
+    def __repr__(self):
+        return (
+            'SharedFrame(frame_type={0.frame_type}, index={0.index}, '
+            'sequence={0.sequence}, timestamp={0.timestamp}, '
+            'format={0.format})').format(self)
+
+class SharedFrameSubscriber(object):
+    """Read frames published by a :py:class:`.SharedFramePublisher`.
+
+    The subscriber tracks, for each frame type, the index of the next frame it
+    has not yet read. If the publisher overtakes a subscriber, the frames which
+    were overwritten are skipped and counted in :py:attr:`.missed`.
+
+    Args:
+        name (str): the name of the shared memory block.
+        poll_interval (number): seconds to sleep between checks for a new
+            frame when waiting.
+
+    .. py:attribute:: missed
+
+        (dict) A mapping from :py:class:`freenect2.FrameType` to the number of
+        frames skipped because they were overwritten before being read.
+
+    """
+    def __init__(self, name, poll_interval=0.001):
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching registers the block with the
+            # resource tracker, which would unlink it when this process exits.
+            from multiprocessing import resource_tracker
+            self._shm = shared_memory.SharedMemory(name=name)
+            if self._shm._name not in _published_names:
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+
+        self.poll_interval = poll_interval
+        self._rings = _map_rings(self._shm.buf)
+        self._next_index = dict(
+            (frame_type, ring.write_count)
+            for frame_type, ring in self._rings.items())
+        self.missed = dict((frame_type, 0) for frame_type in self._rings)
+
+    @property
+    def frame_types(self):
+        """The :py:class:`freenect2.FrameType` values being published."""
+        return list(self._rings)
+
+    def _read(self, frame_type, index):
+        frame = SharedFrame(self._rings[frame_type], index)
+        return frame if frame.is_valid() else None
+
+    def get(self, frame_type, timeout=None):
+        """Return the next unread :py:class:`.SharedFrame` of the given type,
+        waiting for one to be published if necessary. Raises
+        :py:class:`freenect2.NoFrameReceivedError` if no frame is published
+        within *timeout* seconds."""
+        ring = self._rings[frame_type]
+        deadline = None if timeout is None else _monotonic() + timeout
+        while True:
+            write_count = ring.write_count
+            index = self._next_index[frame_type]
+            if index < write_count - ring.n_slots:
+                self.missed[frame_type] += write_count - ring.n_slots - index
+                index = write_count - ring.n_slots
+            if index < write_count:
+                self._next_index[frame_type] = index + 1
+                frame = self._read(frame_type, index)
+                if frame is not None:
+                    return frame
+                self.missed[frame_type] += 1
+                continue
+            if deadline is not None and _monotonic() >= deadline:
+                raise NoFrameReceivedError()
+            time.sleep(self.poll_interval)
+
+    def latest(self, frame_type):
+        """Return the most recently published :py:class:`.SharedFrame` of the
+        given type or None if none has been published. Any older unread
+        frames are skipped without being counted in :py:attr:`.missed`."""
+        ring = self._rings[frame_type]
+        while True:
+            write_count = ring.write_count
+            if write_count == 0:
+                return None
+            self._next_index[frame_type] = write_count
+            frame = self._read(frame_type, write_count - 1)
+            if frame is not None:
+                return frame
+
+    def close(self):
+        """Detach from the shared memory block. Any arrays from frames read
+        by this subscriber must no longer be used."""
+        self._rings = {}
+        self._shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,89 @@
+import struct
+
+import numpy as np
+import pytest
+
+from freenect2 import Frame, FrameFormat
+from freenect2.codec import DepthCodecError, decode_depth, encode_depth
+
+def _rvl_decode(data):
+    """A straightforward Python implementation of the RVL decoder used as a
+    reference for the native codec."""
+    magic, width, height = struct.unpack_from('<4sHH', data)
+    assert magic == b'RVL1'
+    words = struct.unpack_from(
+        '<{}I'.format((len(data) - 8) // 4), data, 8)
+    nibbles = (
+        (word >> shift) & 0xf for word in words
+        for shift in range(28, -4, -4))
+
+    def get():
+        value, shift = 0, 0
+        while True:
+            nibble = next(nibbles)
+            value |= (nibble & 0x7) << shift
+            if not nibble & 0x8:
+                return value
+            shift += 3
+
+    out, previous = [], 0
+    while len(out) < width * height:
+        out.extend([0] * get())
+        for _ in range(get()):
+            delta = get()
+            previous += (delta >> 1) ^ -(delta & 1)
+            out.append(previous)
+    assert len(out) == width * height
+    return np.array(out, dtype=np.float32).reshape((height, width))
+
+def _random_depth(seed=0):
+    rng = np.random.RandomState(seed)
+    depth = rng.uniform(500, 4500, (424, 512)).astype(np.float32)
+    depth[rng.uniform(size=depth.shape) < 0.2] = 0
+    return np.floor(depth)
+
+@pytest.mark.parametrize('depth', [
+    _random_depth(),
+    np.zeros((424, 512), dtype=np.float32),
+    np.full((424, 512), 1234, dtype=np.float32),
+    np.arange(424 * 512, dtype=np.float32).reshape((424, 512)) % 8000,
+    np.full((1, 1), 7, dtype=np.float32),
+    np.tile(np.array([1, 65535], dtype=np.float32), (3, 5)),
+])
+def test_round_trip(depth):
+    assert np.array_equal(decode_depth(encode_depth(depth)), depth)
+    assert np.array_equal(_rvl_decode(encode_depth(depth)), depth)
+
+    depth_u16 = depth.astype(np.uint16)
+    data = encode_depth(depth_u16)
+    assert data == encode_depth(depth)
+    assert np.array_equal(decode_depth(data, dtype=np.uint16), depth_u16)
+
+def test_float_rounding():
+    depth = np.array([[0.4, 0.6, 1000.5, -3, np.nan, 2.49]], dtype=np.float32)
+    assert np.array_equal(
+        decode_depth(encode_depth(depth)),
+        np.array([[0, 1, 1001, 0, 0, 2]], dtype=np.float32))
+
+def test_frame_round_trip():
+    depth = _random_depth()
+    data = encode_depth(Frame.from_array(depth))
+    out = Frame.create(512, 424, 4)
+    assert decode_depth(data, out=out) is out
+    assert out.format is FrameFormat.Float
+    assert np.array_equal(out.to_array(), depth)
+
+def test_malformed():
+    data = encode_depth(_random_depth())
+    for bad in (data[:-8], b'XXXX' + data[4:], data[:3]):
+        with pytest.raises(DepthCodecError):
+            decode_depth(bad)
+
+def test_read_only_out():
+    data = encode_depth(_random_depth())
+    out = np.empty((424, 512), dtype=np.float32)
+    out.flags.writeable = False
+    with pytest.raises(ValueError):
+        decode_depth(data, out=out)
+    with pytest.raises(ValueError):
+        decode_depth(data, out=Frame.from_array(out))
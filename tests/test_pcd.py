@@ -0,0 +1,121 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+
+from freenect2 import Frame, _lzf_compress, ffi, lib, write_pcd
+
+def _lzf_decode(data, size):
+    """A straightforward Python implementation of liblzf's lzf_decompress used
+    as a reference for the native codec."""
+    data, out, ip = bytearray(data), bytearray(), 0
+    while ip < len(data):
+        ctrl = data[ip]
+        ip += 1
+        if ctrl < 32:
+            out += data[ip:ip + ctrl + 1]
+            ip += ctrl + 1
+            continue
+        length = ctrl >> 5
+        if length == 7:
+            length += data[ip]
+            ip += 1
+        ref = len(out) - ((ctrl & 0x1f) << 8) - data[ip] - 1
+        ip += 1
+        assert ref >= 0
+        for idx in range(length + 2):
+            out.append(out[ref + idx])
+    assert len(out) == size
+    return bytes(out)
+
+def _lzf_decompress(data, size):
+    out = bytearray(size)
+    assert lib.freenect2_lzf_decompress(
+        ffi.from_buffer(data), len(data), ffi.from_buffer(out), size) == size
+    return bytes(out)
+
+def _random_bytes(rng, size, high=256):
+    return bytes(bytearray(rng.randint(0, high, size).astype(np.uint8)))
+
+def _inputs():
+    rng = np.random.RandomState(0)
+    # Repeated random blocks give matches at distances either side of the
+    # largest offset LZF can encode.
+    blocks = [_random_bytes(rng, size) for size in (8191, 8192, 8193)]
+    return [block * 2 for block in blocks] + [
+        b'x',
+        b'xy',
+        b'xyz',
+        _random_bytes(rng, 10000),
+        _random_bytes(rng, 10000, high=4),
+        b'\0' * 10000,
+        b'abcdefgh' * 1000,
+        np.linspace(0, 1, 5000, dtype=np.float32).tobytes(),
+    ]
+
+@pytest.mark.parametrize('data', _inputs())
+def test_lzf_round_trip(data):
+    compressed = bytes(_lzf_compress(np.frombuffer(data, dtype=np.uint8)))
+    assert _lzf_decode(compressed, len(data)) == data
+    assert _lzf_decompress(compressed, len(data)) == data
+
+def test_lzf_malformed():
+    compressed = bytes(_lzf_compress(np.zeros(1000, dtype=np.uint8)))
+    out = bytearray(1000)
+    for bad in (compressed[:-1], b'\x20\x00' + compressed):
+        assert lib.freenect2_lzf_decompress(
+            ffi.from_buffer(bad), len(bad), ffi.from_buffer(out), len(out)) == 0
+
+def _read_pcd(data):
+    """Return the header dict and data of a PCD file."""
+    fobj = io.BytesIO(data)
+    header = {}
+    while 'DATA' not in header:
+        key, value = fobj.readline().decode().strip().split(' ', 1)
+        header[key] = value
+    return header, fobj.read()
+
+def _cloud(width=64, height=48):
+    rng = np.random.RandomState(1)
+    points = rng.uniform(-2, 2, (height, width, 3)).astype(np.float32)
+    points[rng.uniform(size=(height, width)) < 0.3, 2] = np.nan
+    bgrx = rng.randint(0, 256, (height, width, 4)).astype(np.uint8)
+    return points, Frame.from_array(bgrx)
+
+@pytest.mark.parametrize('with_rgb', [False, True])
+@pytest.mark.parametrize('skip_invalid', [False, True])
+def test_compressed_pcd(with_rgb, skip_invalid):
+    points, rgb = _cloud()
+    if not with_rgb:
+        rgb = None
+
+    binary, compressed = io.BytesIO(), io.BytesIO()
+    write_pcd(binary, points, rgb, skip_invalid=skip_invalid)
+    write_pcd(compressed, points, rgb, skip_invalid=skip_invalid,
+              compressed=True)
+    binary_header, binary_data = _read_pcd(binary.getvalue())
+    header, data = _read_pcd(compressed.getvalue())
+
+    assert header.pop('DATA') == 'binary_compressed'
+    assert binary_header.pop('DATA') == 'binary'
+    assert header == binary_header
+
+    compressed_size, size = struct.unpack_from('<II', data)
+    payload = data[8:]
+    assert len(payload) == compressed_size
+
+    # Compressed data is stored one field after another
+    n_fields = len(header['FIELDS'].split())
+    n_points = int(header['POINTS'])
+    fields = np.frombuffer(
+        _lzf_decode(payload, size), dtype='<u4').reshape((n_fields, n_points))
+    records = np.frombuffer(
+        binary_data, dtype='<u4').reshape((n_points, n_fields))
+    assert np.array_equal(fields.T, records)
+
+    xyz = fields[:3].T.view(np.float32)
+    expected = points.reshape((-1, 3))
+    if skip_invalid:
+        expected = expected[np.isfinite(expected[:, 2])]
+    np.testing.assert_array_equal(xyz, expected)
@@ -0,0 +1,55 @@
+import io
+
+import numpy as np
+
+from freenect2 import Frame, FrameFormat, FrameType
+from freenect2.recording import (
+    Recorder, RecordingReader, _FILE_MAGIC, _RECORD_HEADER)
+
+# Size of a record holding an uncompressed 512x424 depth frame
+_RECORD_SIZE = _RECORD_HEADER.size + 424 * 512 * 4
+
+def _depth_frame(value, timestamp):
+    frame = Frame.from_array(
+        np.full((424, 512), value, dtype=np.float32), FrameFormat.Float)
+    frame.timestamp = timestamp
+    return frame
+
+def _write_recording(path, n_frames):
+    with Recorder(path) as recorder:
+        for idx in range(n_frames):
+            recorder(FrameType.Depth, _depth_frame(idx + 1, idx))
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join('capture.fn2'))
+    _write_recording(path, 3)
+    with RecordingReader(path) as reader:
+        assert len(reader) == 3
+        for idx, (frame_type, frame) in enumerate(reader):
+            assert frame_type is FrameType.Depth
+            assert frame.timestamp == idx
+            assert np.all(frame.to_array() == idx + 1)
+
+def test_truncated_recording(tmpdir):
+    path = str(tmpdir.join('capture.fn2'))
+    _write_recording(path, 3)
+
+    # Cut the recording off part way through the data of the third record as
+    # if the recorder had stopped while writing it.
+    with io.open(path, 'r+b') as fobj:
+        fobj.truncate(len(_FILE_MAGIC) + 2 * _RECORD_SIZE + _RECORD_HEADER.size + 1000)
+
+    with RecordingReader(path) as reader:
+        assert len(reader) == 2
+        frames = list(reader)
+    assert [frame.timestamp for _, frame in frames] == [0, 1]
+    assert np.all(frames[1][1].to_array() == 2)
+
+def test_truncated_header(tmpdir):
+    path = str(tmpdir.join('capture.fn2'))
+    _write_recording(path, 2)
+    with io.open(path, 'r+b') as fobj:
+        fobj.truncate(len(_FILE_MAGIC) + _RECORD_SIZE + 10)
+
+    with RecordingReader(path) as reader:
+        assert len(list(reader)) == 1